@@ -0,0 +1,213 @@
+"""
+Benchmarks for the render pipeline.
+
+Each case records wall time (median over --repeat runs), peak Python memory
+(tracemalloc, parent process only) and output size in bytes. Results can be
+saved as a baseline and later runs fail when a case regresses by more than
+--threshold against it. Wall time changes below --noise-floor are ignored, so
+sub-millisecond cases (e.g. a single fsync) don't fail on jitter.
+
+Usage (from the project root):
+    python benchmarks/bench_render.py                   # run and compare with baseline
+    python benchmarks/bench_render.py --save-baseline   # store current numbers as baseline
+    python benchmarks/bench_render.py --only overlay    # run cases whose name contains 'overlay'
+
+Baselines depend on the machine, so each developer keeps their own
+benchmarks/baseline.json (it is not committed).
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Callable, Dict, List
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "src"))
+
+from schemas import Fields, WeekRecord  # noqa: E402
+from file_manager import get_template_path  # noqa: E402
+
+BASELINE_PATH = Path(__file__).resolve().parent / "baseline.json"
+TEMPLATE_PATH = str(get_template_path())
+
+SHORT_TEXT = "Arbeit an Angular Services"
+LONG_TEXT = "\n".join(
+    f"- Aufgabe {i}: Datenbankmigration, Überprüfung der Schnittstellen und Fehlerbehebung im Backend"
+    for i in range(14)
+)
+
+
+def make_fields(text: str) -> Fields:
+    fields = Fields()
+    fields.name.content = "Max Mustermann"
+    fields.ausbildung_jahr.content = "2"
+    fields.week_no.content = "12"
+    fields.start_date.content = "01/09/2025"
+    fields.end_date.content = "05/09/2025"
+    fields.date_of_sign.content = fields.end_date.content
+    fields.date_of_sign_2.content = fields.end_date.content
+    fields.texts_1.content = text
+    fields.texts_2.content = text
+    fields.texts_3.content = text
+    fields.hour_1.content = "40"
+    return fields
+
+
+def case_overlay(text: str) -> Callable[[Path], int]:
+    def run(_: Path) -> int:
+        from generator import create_overlay
+        fields = make_fields(text)
+        return len(create_overlay(fields.as_data(), fields.as_coords(), **fields.render_options()).getvalue())
+    return run
+
+
+def case_insert_text_on_pdf(work_dir: Path) -> int:
+    from generator import insert_text_on_pdf
+    fields = make_fields(LONG_TEXT)
+    output_path = work_dir / "report.pdf"
+    insert_text_on_pdf(TEMPLATE_PATH, str(output_path), fields.as_data(), fields.as_coords(), **fields.render_options())
+    return output_path.stat().st_size
+
+
+def case_save_configuration(work_dir: Path) -> int:
+    from file_manager import save_configuration, get_config_path
+    with contextlib.redirect_stdout(io.StringIO()):
+        # Unchanged values are skipped otherwise, which would time a no-op
+        save_configuration(make_fields(SHORT_TEXT), force=True)
+    return get_config_path().stat().st_size
+
+
+def case_load_configuration(work_dir: Path) -> int:
+    from file_manager import load_configuration, get_config_path
+    with contextlib.redirect_stdout(io.StringIO()):
+        load_configuration(Fields())
+    return get_config_path().stat().st_size
+
+
+def case_batch(weeks: int) -> Callable[[Path], int]:
+    def run(work_dir: Path) -> int:
+        from batch import build_week_records, render_batch
+        fields = make_fields(SHORT_TEXT)
+        records = build_week_records("01/09/2025", "31/12/2035", 1, template=WeekRecord.from_fields(fields))[:weeks]
+        output_dir = work_dir / f"batch_{weeks}"
+        # Every run renders into the same directory, where the manifest would skip all weeks
+        result = render_batch(records, fields, TEMPLATE_PATH, str(output_dir), force=True)
+        if result.failed:
+            raise RuntimeError(f"{len(result.failed)} reports failed: {result.failed[0]}")
+        return sum(path.stat().st_size for path in result.generated)
+    return run
+
+
+def case_combined(weeks: int) -> Callable[[Path], int]:
+    def run(work_dir: Path) -> int:
+        from batch import build_week_records, export_combined
+        fields = make_fields(SHORT_TEXT)
+        records = build_week_records("01/09/2025", "31/12/2035", 1, template=WeekRecord.from_fields(fields))[:weeks]
+        output_path = work_dir / f"combined_{weeks}.pdf"
+        export_combined(records, fields, TEMPLATE_PATH, str(output_path))
+        return output_path.stat().st_size
+    return run
+
+
+# name -> (function, default repeat count)
+CASES: Dict[str, tuple] = {
+    "overlay_short": (case_overlay(SHORT_TEXT), 50),
+    "overlay_long": (case_overlay(LONG_TEXT), 50),
+    "insert_text_on_pdf": (case_insert_text_on_pdf, 10),
+    "save_configuration": (case_save_configuration, 50),
+    "load_configuration": (case_load_configuration, 50),
+    "batch_52": (case_batch(52), 1),
+    "batch_150": (case_batch(150), 1),
+    "combined_52": (case_combined(52), 3),
+}
+
+
+def run_case(func: Callable[[Path], int], repeat: int, work_dir: Path) -> dict:
+    # Warm-up run, so import and cache fill costs are not part of the numbers
+    func(work_dir)
+
+    timings: List[float] = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        output_bytes = func(work_dir)
+        timings.append(time.perf_counter() - start)
+
+    # Memory is measured in a separate run, tracemalloc slows everything down
+    tracemalloc.start()
+    func(work_dir)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "wall_time_s": statistics.median(timings),
+        "peak_memory_bytes": peak,
+        "output_bytes": output_bytes,
+    }
+
+
+def compare(name: str, result: dict, baseline: dict, threshold: float, noise_floor_s: float = 0.0) -> List[str]:
+    """Return a message for every metric that regressed by more than threshold (and, for wall time, by more than noise_floor_s)"""
+    regressions = []
+    for metric, value in result.items():
+        base = baseline.get(metric)
+        if not base:
+            continue
+        change = (value - base) / base
+        if metric == "wall_time_s" and value - base <= noise_floor_s:
+            continue
+        if change > threshold:
+            regressions.append(f"{name}.{metric}: {base:.6g} -> {value:.6g} (+{change:.0%})")
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the Berichtsheft render pipeline.")
+    parser.add_argument("--only", help="Only run cases whose name contains this text")
+    parser.add_argument("--repeat", type=int, help="Override the number of timed runs per case")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Allowed regression as a fraction (default: 0.2 = 20%%)")
+    parser.add_argument("--noise-floor", type=float, default=2.0, help="Wall time changes below this many milliseconds are never a regression (default: 2)")
+    parser.add_argument("--baseline", type=Path, default=BASELINE_PATH, help="Baseline file (default: benchmarks/baseline.json)")
+    parser.add_argument("--save-baseline", action="store_true", help="Store the results as the new baseline")
+    args = parser.parse_args(argv)
+
+    baseline = json.loads(args.baseline.read_text(encoding="utf-8")) if args.baseline.exists() else {}
+    results = {}
+    regressions = []
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        work_dir = Path(temp_dir)
+        # Keep the configuration benchmarks away from the real ~/.berichtsheft_generator
+        os.environ["HOME"] = os.environ["USERPROFILE"] = str(work_dir)
+
+        for name, (func, default_repeat) in CASES.items():
+            if args.only and args.only not in name:
+                continue
+            result = run_case(func, args.repeat or default_repeat, work_dir)
+            results[name] = result
+            print(f"{name:<22} {result['wall_time_s'] * 1000:10.2f} ms {result['peak_memory_bytes'] / 1024:10.1f} KiB peak {result['output_bytes']:10d} bytes")
+            if name in baseline:
+                regressions.extend(compare(name, result, baseline[name], args.threshold, args.noise_floor / 1000))
+
+    if args.save_baseline:
+        baseline.update(results)
+        args.baseline.write_text(json.dumps(baseline, indent=2), encoding="utf-8")
+        print(f"Baseline saved to {args.baseline}")
+        return 0
+
+    if regressions:
+        print("\nRegressions:")
+        for message in regressions:
+            print(f"  {message}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
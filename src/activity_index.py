@@ -0,0 +1,217 @@
+"""
+In-memory search index over previously entered activity lines.
+
+Every line of texts_1/texts_2/texts_3 is indexed by its words: a character trie
+over all distinct words maps word prefixes to the lines that contain them.
+Lookups walk the trie instead of scanning all lines, and a bounded edit-distance
+walk of the same trie provides fuzzy matches for typos (see max_edit_distance).
+"""
+import heapq
+import re
+from typing import Dict, Iterable, List, Optional, Set
+from schemas import WeekRecord
+from history import week_key
+
+_WORD_RE = re.compile(r"\w+")
+_BULLET_RE = re.compile(r"^\s*(?:[-*•]|\d+[.)])\s*")
+
+# Key under which a trie node stores the word that ends there
+_WORD_END = "\0"
+
+
+def split_lines(text: str) -> List[str]:
+    """Split a textarea value into activity lines, without list bullets"""
+    lines = []
+    for line in text.split("\n"):
+        line = _BULLET_RE.sub("", line).strip()
+        if line:
+            lines.append(line)
+    return lines
+
+
+def tokenize(text: str) -> List[str]:
+    return _WORD_RE.findall(text.lower())
+
+
+def max_edit_distance(length: int) -> int:
+    """Typos tolerated in a word of this length: none below 4 letters, 1 up to 7, 2 beyond"""
+    if length < 4:
+        return 0
+    return 1 if length < 8 else 2
+
+
+class ActivityIndex:
+    """Word trie + inverted index of activity lines, ranked by how many weeks used a line"""
+
+    def __init__(self):
+        self._trie: dict = {}
+        self._lines: List[str] = []  # line id -> line as first typed
+        self._line_ids: Dict[str, int] = {}  # normalized line -> line id
+        self._word_lines: Dict[str, Set[int]] = {}  # word -> line ids
+        self._counts: Dict[int, int] = {}  # line id -> number of weeks using it
+        self._week_lines: Dict[str, Set[int]] = {}  # week key -> line ids
+
+    def __len__(self) -> int:
+        return sum(1 for count in self._counts.values() if count > 0)
+
+    def _add_line(self, line: str) -> int:
+        normalized = " ".join(line.lower().split())
+        line_id = self._line_ids.get(normalized)
+        if line_id is not None:
+            return line_id
+
+        line_id = len(self._lines)
+        self._lines.append(line)
+        self._line_ids[normalized] = line_id
+        self._counts[line_id] = 0
+        for word in set(tokenize(line)):
+            if word not in self._word_lines:
+                self._word_lines[word] = set()
+                node = self._trie
+                for char in word:
+                    node = node.setdefault(char, {})
+                node[_WORD_END] = word
+            self._word_lines[word].add(line_id)
+        return line_id
+
+    def set_week(self, week_key: str, texts: Iterable[str]) -> None:
+        """Replace the indexed lines of one week (call again whenever the week is saved)"""
+        new_ids = {self._add_line(line) for text in texts for line in split_lines(text)}
+        old_ids = self._week_lines.get(week_key, set())
+        for line_id in old_ids - new_ids:
+            self._counts[line_id] -= 1
+        for line_id in new_ids - old_ids:
+            self._counts[line_id] += 1
+        self._week_lines[week_key] = new_ids
+
+    def add_records(self, records: Iterable[WeekRecord]) -> None:
+        """Index saved weeks, e.g. everything in the history store"""
+        for record in records:
+            key = week_key(record.start_date) or record.start_date
+            self.set_week(key, (record.texts_1, record.texts_2, record.texts_3))
+
+    def _words_with_prefix(self, prefix: str) -> List[str]:
+        node = self._trie
+        for char in prefix:
+            node = node.get(char)
+            if node is None:
+                return []
+        words = []
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            for key, child in node.items():
+                if key == _WORD_END:
+                    words.append(child)
+                else:
+                    stack.append(child)
+        return words
+
+    def _fuzzy_words(self, word: str, max_distance: int, prefix: bool) -> List[str]:
+        """
+        Words within max_distance edits of word (Levenshtein, walked over the trie).
+
+        With prefix=True, a word matches if any of its prefixes is close enough,
+        so partially typed words still find their completions.
+
+        Only the band of the DP row within max_distance of the diagonal is
+        computed (cells outside it can't be within the budget), and a branch is
+        left as soon as no cell of its row is within the budget.
+        """
+        matches = []
+        length = len(word)
+        over = max_distance + 1  # any value above the budget
+        # The first letter has to match: typos there are rare, and it keeps the
+        # walk to one branch of the trie. (node, depth, previous DP row)
+        start = self._trie.get(word[:1])
+        if start is None:
+            return []
+        row = [over] * (length + 1)
+        row[0] = 1
+        row[1] = 0
+        for column in range(2, min(length, 1 + max_distance) + 1):
+            row[column] = column - 1
+        stack = [(start, 1, row)]
+        while stack:
+            node, depth, previous_row = stack.pop()
+            depth += 1
+            low = max(1, depth - max_distance)
+            high = min(length, depth + max_distance)
+            for char, child in node.items():
+                if char == _WORD_END:
+                    continue
+                row = [over] * (length + 1)
+                row[0] = min(depth, over)
+                best = row[0]
+                for column in range(low, high + 1):
+                    cost = 0 if word[column - 1] == char else 1
+                    value = min(row[column - 1] + 1, previous_row[column] + 1, previous_row[column - 1] + cost, over)
+                    row[column] = value
+                    if value < best:
+                        best = value
+                if best > max_distance:
+                    continue
+                if prefix and row[-1] <= max_distance:
+                    # The path so far is close to the typed word, take everything below it
+                    stack_words = [child]
+                    while stack_words:
+                        below = stack_words.pop()
+                        for key, value in below.items():
+                            if key == _WORD_END:
+                                matches.append(value)
+                            else:
+                                stack_words.append(value)
+                    continue
+                if _WORD_END in child and row[-1] <= max_distance:
+                    matches.append(child[_WORD_END])
+                stack.append((child, depth, row))
+        return list(set(matches))
+
+    def _lines_for_token(self, token: str, is_prefix: bool, fuzzy: bool) -> Set[int]:
+        words = self._words_with_prefix(token) if is_prefix else ([token] if token in self._word_lines else [])
+        if not words and fuzzy and max_edit_distance(len(token)):
+            words = self._fuzzy_words(token, max_edit_distance(len(token)), is_prefix)
+        line_ids: Set[int] = set()
+        for word in words:
+            line_ids |= self._word_lines[word]
+        return line_ids
+
+    def search(self, query: str, limit: int = 8, fuzzy: bool = True) -> List[str]:
+        """
+        Lines matching every word of query, the last word also as a prefix.
+
+        Results are ordered by how many weeks used the line. Words that match
+        nothing exactly are looked up with a small edit distance if fuzzy is set.
+        """
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+
+        candidates: Optional[Set[int]] = None
+        for position, token in enumerate(tokens):
+            is_last = position == len(tokens) - 1
+            line_ids = self._lines_for_token(token, is_prefix=is_last and not query[-1:].isspace(), fuzzy=fuzzy)
+            candidates = line_ids if candidates is None else candidates & line_ids
+            if not candidates:
+                return []
+
+        ranked = heapq.nlargest(
+            limit,
+            (line_id for line_id in candidates if self._counts[line_id] > 0),
+            key=lambda line_id: (self._counts[line_id], line_id),
+        )
+        return [self._lines[line_id] for line_id in ranked]
+
+    def suggest(self, text: str, limit: int = 8, results: Optional[List[str]] = None) -> List[str]:
+        """
+        Completions for a partially typed line.
+
+        results: search(text, limit + 1) if already at hand, so the index is not searched twice
+        """
+        normalized = " ".join(text.lower().split())
+        if results is None:
+            results = self.search(text, limit + 1)
+        return [
+            line for line in results
+            if " ".join(line.lower().split()) != normalized
+        ][:limit]
@@ -0,0 +1,464 @@
+"""
+Batch generation of many weekly reports across a process pool.
+
+Each worker process keeps its own TemplateRenderer, so the template is parsed
+once per worker instead of once per report.
+
+Reports can also be streamed into a ZIP archive (stream_archive): workers
+render to bytes, a small window of reports is kept in flight and each PDF is
+written into the archive and dropped as soon as it is its turn, so memory use
+does not depend on the number of weeks.
+
+A server with many users starts one shared pool (start_shared_pool) that all
+batches, combined exports and single reports are rendered in. Every caller keeps only a small
+window of jobs queued in it, so a user exporting a year does not make
+everybody else wait for the whole year.
+"""
+import os
+import threading
+import time
+import zipfile
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from contextlib import ExitStack, contextmanager
+from dataclasses import dataclass, field
+from datetime import timedelta
+from pathlib import Path
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple
+from schemas import Fields, WeekRecord, PROFILE_FIELDS
+from file_manager import atomic_open, get_report_filename
+from training_calendar import format_date, get_calendar, parse_date, parse_date_and_format
+from instrumentation import Timings, capture_profile, record_timings
+
+
+# Renderer owned by the current worker process (set by _init_worker)
+_worker_renderer = None
+
+# Pool shared by all callers in this process, if one was started (see start_shared_pool)
+_shared_pool: Optional[ProcessPoolExecutor] = None
+_shared_workers = 0
+_shared_lock = threading.Lock()
+
+# Longest date range of a batch: a training of three and a half years
+MAX_BATCH_WEEKS = 183
+
+@dataclass
+class BatchResult:
+    """Outcome of a batch run"""
+    generated: List[Path] = field(default_factory=list)
+    failed: List[Tuple[str, str]] = field(default_factory=list)  # (filename, error)
+    skipped: List[Path] = field(default_factory=list)  # unchanged since the last run
+
+    @property
+    def total(self) -> int:
+        return len(self.generated) + len(self.failed) + len(self.skipped)
+
+
+def build_week_records(start_date: str, end_date: str, first_week_no: int = 1, template: Optional[WeekRecord] = None, adjust_hours: bool = True) -> List[WeekRecord]:
+    """
+    Build one WeekRecord per training week between start_date and end_date (inclusive).
+
+    Texts and hours are copied from template, so the records can be edited per week afterwards.
+    With adjust_hours, numeric hours are reduced in weeks with public holidays.
+    Ranges of more than MAX_BATCH_WEEKS weeks give no records.
+    """
+    if template is None:
+        template = WeekRecord()
+
+    first = parse_date_and_format(start_date)
+    last = parse_date(end_date)
+    if first is None or last is None:
+        return []
+    first_day, format_str = first
+
+    first_monday = first_day - timedelta(days=first_day.weekday())
+    weeks = (last - first_monday).days // 7 + 1
+    if weeks <= 0 or weeks > MAX_BATCH_WEEKS:
+        return []
+    # Only the weeks of the range, so the last one ends by date.max (a Friday) at the latest
+    calendar = get_calendar(first_monday, first_week_no, weeks)
+
+    records = []
+    for week in calendar.weeks_between(first_day, last):
+        hours = [week.scale_hours(value) if adjust_hours else value for value in (template.hour_1, template.hour_2, template.hour_3)]
+        records.append(WeekRecord(
+            week_no=str(week.week_no),
+            start_date=format_date(week.monday, format_str),
+            end_date=format_date(week.friday, format_str),
+            texts_1=template.texts_1,
+            hour_1=hours[0],
+            texts_2=template.texts_2,
+            hour_2=hours[1],
+            texts_3=template.texts_3,
+            hour_3=hours[2],
+        ))
+    return records
+
+
+def _init_worker(template_path: str) -> None:
+    """Create this worker's renderer and parse the template once"""
+    global _worker_renderer
+    from generator import TemplateRenderer
+    _worker_renderer = TemplateRenderer()
+    _worker_renderer.get_page_forms(template_path)
+
+
+def _render_job(template_path: str, output_path: str, data: dict, coords: dict, options: dict) -> str:
+    """Render a single report inside a worker process"""
+    _worker_renderer.render(template_path, output_path, data, coords, **options)
+    return output_path
+
+
+def _render_measured(render: Callable[[], object], profile: bool) -> Tuple[Timings, Optional[str]]:
+    """Run render, recording its timings and, with profile, its cProfile output"""
+    with ExitStack() as stack:
+        timings = stack.enter_context(record_timings())
+        capture = stack.enter_context(capture_profile()) if profile else None
+        render()
+    return timings, capture.stats_text() if capture is not None else None
+
+
+def _render_measured_job(template_path: str, output_path: str, data: dict, coords: dict, options: dict, profile: bool) -> Tuple[Timings, Optional[str]]:
+    """Render a single report inside a worker process; the timings are recorded where the work is done"""
+    return _render_measured(lambda: _worker_renderer.render(template_path, output_path, data, coords, **options), profile)
+
+
+def _render_combined_job(template_path: str, output_path: str, pages_data: List[dict], coords: dict, options: dict) -> int:
+    """Render a combined export inside a worker process"""
+    with atomic_open(output_path) as f:
+        return _worker_renderer.render_combined(template_path, f, pages_data, coords, **options)
+
+
+def _render_bytes_job(template_path: str, data: dict, coords: dict, options: dict) -> bytes:
+    """Render a single report inside a worker process and return the PDF"""
+    return _worker_renderer.render_to_bytes(template_path, data, coords, **options)
+
+
+def start_shared_pool(template_path: str, max_workers: Optional[int] = None) -> int:
+    """
+    Start the process pool that render_batch, export_combined, stream_archive and render_report_file use from now on.
+
+    Returns the number of workers. Without a shared pool, every batch starts a pool of its own.
+    """
+    global _shared_pool, _shared_workers
+    with _shared_lock:
+        if _shared_pool is None:
+            _shared_workers = max_workers or os.cpu_count() or 1
+            _shared_pool = ProcessPoolExecutor(max_workers=_shared_workers, initializer=_init_worker, initargs=(str(template_path),))
+        return _shared_workers
+
+
+def shutdown_shared_pool() -> None:
+    global _shared_pool
+    with _shared_lock:
+        pool, _shared_pool = _shared_pool, None
+    if pool is not None:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+@contextmanager
+def _worker_pool(template_path: str, max_workers: Optional[int], job_count: int) -> Iterator[Tuple[ProcessPoolExecutor, int]]:
+    """(executor, workers): the shared pool if there is one, else a pool for this batch only"""
+    pool = _shared_pool
+    if pool is not None:
+        yield pool, _shared_workers
+        return
+    workers = min(max_workers or os.cpu_count() or 1, job_count)
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(template_path,)) as executor:
+        yield executor, workers
+
+
+def _submit_windowed(executor: ProcessPoolExecutor, function: Callable, calls: Iterable[tuple], window: int) -> Iterator[Tuple[object, Future]]:
+    """
+    Submit function(*args) for every (tag, args) in calls and yield (tag, future) in call order once it is done.
+
+    At most window calls are queued or running at a time, so results are not
+    held back in memory and a shared pool stays open to other callers.
+    """
+    pending = deque()
+    for tag, args in calls:
+        pending.append((tag, executor.submit(function, *args)))
+        if len(pending) >= window:
+            tag, future = pending.popleft()
+            future.exception()
+            yield tag, future
+    while pending:
+        tag, future = pending.popleft()
+        future.exception()
+        yield tag, future
+
+
+def render_report_file(template_path: str, output_path: str, data: dict, coords: dict, options: dict, profile: bool = False) -> Tuple[Timings, Optional[str]]:
+    """
+    Render one report, in the shared pool if one was started, else in the calling thread.
+
+    Returns the timings of the render and, with profile, its cProfile output.
+    """
+    pool = _shared_pool
+    if pool is not None:
+        return pool.submit(_render_measured_job, str(template_path), str(output_path), data, coords, options, profile).result()
+    from generator import insert_text_on_pdf
+    return _render_measured(lambda: insert_text_on_pdf(str(template_path), str(output_path), data, coords, **options), profile)
+
+
+def week_fields_for(record: WeekRecord, profile: Fields) -> Fields:
+    """Fields of one week: the record's values plus the profile's name, beruf, ..."""
+    week_fields = Fields(layout=profile.layout)
+    for name in PROFILE_FIELDS:
+        getattr(week_fields, name).content = getattr(profile, name).content
+    record.apply_to_fields(week_fields)
+    return week_fields
+
+
+def render_batch(
+    records: List[WeekRecord],
+    profile: Fields,
+    template_path: str,
+    output_dir: str,
+    max_workers: Optional[int] = None,
+    progress: Optional[Callable[[int, int], None]] = None,
+    force: bool = False,
+) -> BatchResult:
+    """
+    Render every record to output_dir using a process pool.
+
+    profile provides the fields shared by all weeks (name, beruf, ...).
+    progress is called with (done, total) after each finished or skipped report.
+    Reports whose inputs are unchanged since they were last rendered into
+    output_dir are skipped, unless force is set.
+    """
+    from output_cache import OutputCache, render_key, report_inputs
+
+    result = BatchResult()
+    total = len(records)
+    if not total:
+        return result
+
+    output_directory = Path(output_dir)
+    output_directory.mkdir(parents=True, exist_ok=True)
+    cache = OutputCache(output_directory)
+
+    # Build all jobs up front in the parent; workers only render
+    jobs = []
+    for record in records:
+        week_fields = week_fields_for(record, profile)
+        output_path = output_directory / get_report_filename(record.week_no, record.start_date)
+        job = (str(output_path), week_fields.as_data(), week_fields.as_coords(), week_fields.render_options())
+        key = render_key(str(template_path), job[1], job[2], **job[3])
+        if not force and cache.is_current(output_path.name, key):
+            result.skipped.append(output_path)
+            continue
+        jobs.append((job, key, report_inputs(week_fields)))
+
+    done = len(result.skipped)
+    if progress is not None and done:
+        progress(done, total)
+    if not jobs:
+        return result
+
+    with _worker_pool(str(template_path), max_workers, len(jobs)) as (executor, workers):
+        calls = (((job[0], key, inputs), (str(template_path), *job)) for job, key, inputs in jobs)
+        for (output_path, key, inputs), future in _submit_windowed(executor, _render_job, calls, 2 * workers):
+            try:
+                future.result()
+                result.generated.append(Path(output_path))
+                cache.record(Path(output_path).name, key, inputs)
+            except Exception as e:
+                result.failed.append((Path(output_path).name, str(e)))
+            done += 1
+            if progress is not None:
+                progress(done, total)
+
+    cache.save()
+    return result
+
+
+def regenerate_stale(
+    profile: Fields,
+    template_path: str,
+    output_dir: str,
+    max_workers: Optional[int] = None,
+    progress: Optional[Callable[[int, int], None]] = None,
+) -> BatchResult:
+    """
+    Re-render the reports in output_dir that are out of date, e.g. after the profile changed.
+
+    Every report listed in the directory's manifest is rebuilt from the week it
+    was generated from and the current profile. Reports whose inputs did not
+    change are skipped. Reports generated before the manifest recorded their
+    inputs are not known and left alone.
+    """
+    from output_cache import OutputCache
+
+    records = OutputCache(output_dir).recorded_weeks()
+    return render_batch(records, profile, template_path, output_dir, max_workers=max_workers, progress=progress)
+
+
+def _range_name(records: List[WeekRecord], suffix: str) -> str:
+    first, last = records[0], records[-1]
+    if first.week_no.strip() and last.week_no.strip():
+        return f"berichtsheft_w{first.week_no.strip()}-w{last.week_no.strip()}{suffix}"
+    return f"berichtsheft_{first.start_date.strip().replace('/', '_')}-{last.start_date.strip().replace('/', '_')}{suffix}"
+
+
+def get_combined_filename(records: List[WeekRecord]) -> str:
+    """Filename for a combined export of records, e.g. berichtsheft_w1-w52.pdf"""
+    return _range_name(records, ".pdf")
+
+
+def get_archive_filename(records: List[WeekRecord]) -> str:
+    """Filename for a ZIP archive of records, e.g. berichtsheft_w1-w52.zip"""
+    return _range_name(records, ".zip")
+
+
+def export_combined(
+    records: List[WeekRecord],
+    profile: Fields,
+    template_path: str,
+    output_path: str,
+    progress: Optional[Callable[[int, int], None]] = None,
+) -> int:
+    """
+    Render all records into one PDF at output_path, e.g. a whole training year for the auditors.
+
+    The template is stored once in the file and shared by every page (see
+    TemplateRenderer.render_combined). Returns the number of pages written.
+
+    With a shared pool the export is one job in it, so it waits its turn like
+    any other render; progress is then only reported once it is done.
+    """
+    from generator import default_renderer
+
+    if not records:
+        return 0
+    Path(output_path).parent.mkdir(parents=True, exist_ok=True)
+    total = len(records)
+    pool = _shared_pool
+    if pool is not None:
+        pages_data = [week_fields_for(record, profile).as_data() for record in records]
+        pages = pool.submit(_render_combined_job, str(template_path), str(output_path), pages_data, profile.as_coords(), profile.render_options()).result()
+        if progress is not None:
+            progress(pages, total)
+        return pages
+
+    pages_data = (week_fields_for(record, profile).as_data() for record in records)
+    with atomic_open(output_path) as f:
+        return default_renderer.render_combined(
+            str(template_path),
+            f,
+            pages_data,
+            profile.as_coords(),
+            progress=None if progress is None else (lambda done: progress(done, total)),
+            **profile.render_options(),
+        )
+
+
+ArchiveJob = Tuple[str, dict, dict, dict]  # (filename, data, coords, render options)
+
+
+def archive_jobs(records: Iterable[WeekRecord], profile: Fields) -> Iterator[ArchiveJob]:
+    """The archive entries for records, built lazily"""
+    for record in records:
+        week_fields = week_fields_for(record, profile)
+        yield (
+            get_report_filename(record.week_no, record.start_date),
+            week_fields.as_data(),
+            week_fields.as_coords(),
+            week_fields.render_options(),
+        )
+
+
+def iter_rendered_reports(jobs: Iterable[ArchiveJob], template_path: str, max_workers: Optional[int] = None) -> Iterator[Tuple[str, bytes]]:
+    """
+    Render jobs in a process pool and yield (filename, pdf_bytes) in job order.
+
+    At most two reports per worker are rendered ahead of the consumer, so only
+    a few PDFs are held in memory at any time, however many jobs there are.
+    """
+    with _worker_pool(str(template_path), max_workers, max_workers or os.cpu_count() or 1) as (executor, workers):
+        calls = ((filename, (str(template_path), data, coords, options)) for filename, data, coords, options in jobs)
+        for filename, future in _submit_windowed(executor, _render_bytes_job, calls, 2 * workers):
+            yield filename, future.result()
+
+
+class _ChunkWriter:
+    """Write target for ZipFile that hands out the written bytes in chunks"""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+        self._position = 0
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        # No seek(): ZipFile then writes sizes after each entry instead of going back
+        return self._position
+
+    def flush(self) -> None:
+        pass
+
+    def take(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def stream_archive(
+    jobs: Iterable[ArchiveJob],
+    template_path: str,
+    max_workers: Optional[int] = None,
+    progress: Optional[Callable[[int], None]] = None,
+) -> Iterator[bytes]:
+    """
+    Render jobs into a ZIP archive that is yielded piece by piece, one report at a time.
+
+    The archive is written without seeking, so the chunks can go straight to a
+    file, a pipe or an HTTP response. progress is called with the number of
+    reports done.
+    """
+    sink = _ChunkWriter()
+    date_time = time.localtime()[:6]
+    with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for done, (filename, pdf) in enumerate(iter_rendered_reports(jobs, template_path, max_workers), start=1):
+            entry = zipfile.ZipInfo(filename, date_time=date_time)
+            entry.compress_type = zipfile.ZIP_DEFLATED
+            archive.writestr(entry, pdf)
+            yield sink.take()
+            if progress is not None:
+                progress(done)
+    # The central directory is written on close
+    yield sink.take()
+
+
+def export_archive(
+    records: List[WeekRecord],
+    profile: Fields,
+    template_path: str,
+    output_path: str,
+    max_workers: Optional[int] = None,
+    progress: Optional[Callable[[int, int], None]] = None,
+) -> int:
+    """
+    Render all records into a ZIP archive of weekly PDFs at output_path, e.g. for the IHK or HR.
+
+    Returns the number of reports written.
+    """
+    if not records:
+        return 0
+    Path(output_path).parent.mkdir(parents=True, exist_ok=True)
+    total = len(records)
+    done = 0
+
+    def on_progress(count: int) -> None:
+        nonlocal done
+        done = count
+        if progress is not None:
+            progress(count, total)
+
+    with atomic_open(output_path) as f:
+        for chunk in stream_archive(archive_jobs(records, profile), template_path, max_workers=min(max_workers or os.cpu_count() or 1, total), progress=on_progress):
+            f.write(chunk)
+    return done
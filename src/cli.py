@@ -0,0 +1,359 @@
+"""
+Headless command line entry point.
+
+Renders weekly reports from JSON or CSV week data without starting the GUI.
+Only the PDF stack is imported (and only once there is something to render),
+so this can be called from cron jobs and scripts.
+
+Examples:
+    python src/cli.py weeks.json -o reports/
+    python src/cli.py weeks.csv --name "Max Mustermann" -o reports/
+    cat weeks.json | python src/cli.py - -o reports/
+
+JSON input is either a list of weeks or {"profile": {...}, "weeks": [...]}.
+CSV input has one week per row. Week keys are the WeekRecord fields
+(week_no, start_date, end_date, texts_1, hour_1, ...). Profile keys (name, beruf,
+abteilung, ausbildung_jahr) may appear in the profile object or on any week/row.
+
+Weeks whose PDF in the output directory is already up to date are not rendered
+again (see output_cache.py); --force renders them anyway.
+
+With -f timesheet (CSV rows of date, hours and activity) or an .ics calendar
+export, the entries are summed into training weeks and their titles drafted
+into the activity texts (see timesheets.py). --training-start or --use-config
+numbers the weeks.
+
+Given a folder, every Markdown or text file in it is read as the notes of one
+week (see notes.py). Only files added or changed since the last run are
+processed; --watch SECONDS keeps checking the folder. --combined FILE puts
+all weeks into one PDF instead, --archive FILE into a ZIP archive of weekly
+PDFs ('-' streams the archive to stdout).
+"""
+import argparse
+import contextlib
+import csv
+import io
+import json
+import sys
+import time
+from dataclasses import asdict
+from pathlib import Path
+from typing import List, Optional, Tuple
+from schemas import Fields, WeekRecord, PROFILE_FIELDS
+from file_manager import get_report_filename, load_configuration
+from template_registry import Layout, get_registry
+from training_calendar import DATE_FORMATS, calendar_for_week, compute_end_date_from_start, date_format_of
+from instrumentation import record_timings, capture_profile
+
+
+def read_input(source: str, input_format: Optional[str] = None) -> Tuple[dict, List[dict]]:
+    """Read week data from a file path or '-' for stdin. Returns (profile, weeks)."""
+    if source == "-":
+        text = sys.stdin.read()
+    else:
+        text = Path(source).read_text(encoding="utf-8-sig")
+        if input_format is None:
+            suffix = Path(source).suffix.lower()
+            if suffix in (".json", ".csv"):
+                input_format = suffix[1:]
+
+    if input_format is None:
+        # Guess from the content when reading stdin or an unknown extension
+        input_format = "json" if text.lstrip().startswith(("[", "{")) else "csv"
+
+    if input_format == "csv":
+        return {}, list(csv.DictReader(io.StringIO(text)))
+
+    data = json.loads(text)
+    if isinstance(data, list):
+        return {}, data
+    return data.get("profile", {}), data.get("weeks", [])
+
+
+def read_timesheet(source: str, input_format: str, calendar=None, date_format: str = DATE_FORMATS[0]) -> List[dict]:
+    """Weeks from a CSV timesheet or ICS calendar export (see timesheets.py), read in one pass"""
+    from timesheets import import_timesheet
+
+    if source == "-":
+        result = import_timesheet(sys.stdin, input_format, calendar, date_format)
+    else:
+        with open(source, "r", encoding="utf-8-sig", newline="") as f:
+            result = import_timesheet(f, input_format, calendar, date_format)
+    for line in result.skipped:
+        print(f"Skipping line {line}: no date or hours", file=sys.stderr)
+    return [asdict(record) for record in result.records()]
+
+
+def build_week_fields(profile: dict, week: dict, layout: Optional[Layout] = None) -> Fields:
+    """Build a Fields instance for one week from the profile and the week's data"""
+    week_fields = Fields() if layout is None else Fields(layout=layout)
+    for name in PROFILE_FIELDS:
+        value = week.get(name) or profile.get(name)
+        if value:
+            getattr(week_fields, name).content = str(value)
+
+    record = WeekRecord.from_dict(week)
+    if record.start_date and not record.end_date:
+        record.end_date = compute_end_date_from_start(record.start_date)
+    record.apply_to_fields(week_fields)
+    return week_fields
+
+
+def resolve_layout(template: Optional[str]) -> Layout:
+    """Layout for a registered template name or a template PDF; PDFs without a layout file use the default layout"""
+    registry = get_registry()
+    if not template:
+        return registry.default
+    if template in registry.names():
+        return registry.get(template)
+    return registry.find_by_pdf(template) or registry.default
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Generate Berichtsheft PDFs without the GUI.")
+    parser.add_argument("input", help="JSON or CSV file with week data, '-' for stdin, or a folder of weekly notes files")
+    parser.add_argument("-o", "--output-dir", default=".", help="Directory for the generated PDFs (default: current directory)")
+    parser.add_argument("-f", "--format", choices=["json", "csv", "timesheet", "ics"], help="Input format: week data (json, csv), a CSV timesheet or an ICS calendar export (default: from file extension or content)")
+    parser.add_argument("-t", "--template", help="Template name or template PDF (default: bundled weekly template)")
+    parser.add_argument("--use-config", action="store_true", help="Start from the profile saved by the GUI")
+    parser.add_argument("--force", action="store_true", help="Render every week, even if its PDF is up to date")
+    parser.add_argument("--combined", metavar="FILE", help="Write all weeks into this single PDF instead of one file per week")
+    parser.add_argument("--archive", metavar="FILE", help="Write all weeks as separate PDFs into this ZIP archive ('-' for stdout)")
+    parser.add_argument("--watch", metavar="SECONDS", type=float, help="With a notes folder: keep running and check it for changes every SECONDS")
+    parser.add_argument("--training-start", metavar="DATE", help="Monday of week 1, to number notes that only have a date (default with --use-config: the saved week)")
+    parser.add_argument("--timings", metavar="PATH", help="Write per-stage timings of every report as JSON to PATH ('-' for stderr)")
+    parser.add_argument("--profile", metavar="PATH", help="Write cProfile stats of the first report to PATH")
+    for name, label in (("name", "Name"), ("beruf", "Profession"), ("abteilung", "Department"), ("ausbildung_jahr", "Training year")):
+        parser.add_argument(f"--{name.replace('_', '-')}", dest=name, help=f"{label} for every week")
+    return parser.parse_args(argv)
+
+
+def export_combined(args: argparse.Namespace, profile: dict, weeks: List[dict], layout: Layout, template_path: Path) -> int:
+    """Render all weeks into the single PDF args.combined"""
+    from generator import default_renderer
+    from file_manager import atomic_open
+
+    skipped = 0
+
+    def pages_data():
+        nonlocal skipped
+        for week in weeks:
+            week_fields = build_week_fields(profile, week, layout)
+            if not week_fields.start_date.content.strip():
+                print(f"Skipping week {week_fields.week_no.content or '?'}: no start_date", file=sys.stderr)
+                skipped += 1
+                continue
+            yield week_fields.as_data()
+
+    output_path = Path(args.combined)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        with atomic_open(output_path) as f:
+            default_renderer.render_combined(str(template_path), f, pages_data(), layout.coords, **layout.render_options)
+    except Exception as e:
+        print(f"Error generating {output_path.name}: {e}", file=sys.stderr)
+        return 1
+    print(output_path)
+    return 1 if skipped else 0
+
+
+def export_archive(args: argparse.Namespace, profile: dict, weeks: List[dict], layout: Layout, template_path: Path) -> int:
+    """Render all weeks into the ZIP archive args.archive, streamed as the reports are rendered"""
+    from batch import stream_archive
+    from file_manager import atomic_open
+
+    skipped = 0
+
+    def jobs():
+        nonlocal skipped
+        for week in weeks:
+            week_fields = build_week_fields(profile, week, layout)
+            if not week_fields.start_date.content.strip():
+                print(f"Skipping week {week_fields.week_no.content or '?'}: no start_date", file=sys.stderr)
+                skipped += 1
+                continue
+            filename = get_report_filename(week_fields.week_no.content, week_fields.start_date.content)
+            yield filename, week_fields.as_data(), layout.coords, layout.render_options
+
+    try:
+        if args.archive == "-":
+            for chunk in stream_archive(jobs(), str(template_path)):
+                sys.stdout.buffer.write(chunk)
+            sys.stdout.buffer.flush()
+        else:
+            output_path = Path(args.archive)
+            output_path.parent.mkdir(parents=True, exist_ok=True)
+            with atomic_open(output_path) as f:
+                for chunk in stream_archive(jobs(), str(template_path)):
+                    f.write(chunk)
+            print(output_path)
+    except Exception as e:
+        print(f"Error generating {args.archive}: {e}", file=sys.stderr)
+        return 1
+    return 1 if skipped else 0
+
+
+def render_weeks(args: argparse.Namespace, profile: dict, weeks: List[dict], layout: Layout, template_path: Path, output_dir: Path) -> List[int]:
+    """Render one PDF per week into output_dir; returns the indices of the weeks that failed"""
+    # Import the PDF stack only once there is something to render
+    from generator import insert_text_on_pdf
+    from output_cache import OutputCache, render_key, report_inputs
+
+    cache = OutputCache(output_dir)
+    failed = []
+    all_timings = []
+    for index, week in enumerate(weeks):
+        week_fields = build_week_fields(profile, week, layout)
+        if not week_fields.start_date.content.strip():
+            print(f"Skipping week {week_fields.week_no.content or '?'}: no start_date", file=sys.stderr)
+            failed.append(index)
+            continue
+
+        output_path = output_dir / get_report_filename(week_fields.week_no.content, week_fields.start_date.content)
+        data = week_fields.as_data()
+        coords = week_fields.as_coords()
+        options = week_fields.render_options()
+        try:
+            key = render_key(str(template_path), data, coords, **options)
+            if not args.force and cache.is_current(output_path.name, key):
+                print(output_path)
+                continue
+
+            with contextlib.ExitStack() as stack:
+                timings = stack.enter_context(record_timings())
+                profile_capture = stack.enter_context(capture_profile()) if args.profile and index == 0 else None
+
+                insert_text_on_pdf(str(template_path), str(output_path), data, coords, **options)
+
+            cache.record(output_path.name, key, report_inputs(week_fields))
+            if profile_capture is not None:
+                profile_capture.dump(args.profile)
+            all_timings.append({"file": output_path.name, **timings.as_dict()})
+            print(output_path)
+        except Exception as e:
+            print(f"Error generating {output_path.name}: {e}", file=sys.stderr)
+            failed.append(index)
+
+    cache.save()
+
+    if args.timings:
+        timings_json = json.dumps(all_timings, indent=2)
+        if args.timings == "-":
+            print(timings_json, file=sys.stderr)
+        else:
+            Path(args.timings).write_text(timings_json, encoding="utf-8")
+
+    return failed
+
+
+
+def ingest_notes(args: argparse.Namespace, profile: dict, layout: Layout, template_path: Path, output_dir: Path, calendar, date_format: str = DATE_FORMATS[0]) -> int:
+    """Render the weeks of all notes files in args.input that are new or changed since the last run"""
+    from notes import INDEX_NAME, NotesIndex
+
+    index = NotesIndex(output_dir / INDEX_NAME)
+    if args.force:
+        index.entries.clear()
+    try:
+        changes = index.scan(args.input, calendar, date_format)
+    except OSError as e:
+        print(f"Error reading {args.input}: {e}", file=sys.stderr)
+        return 2
+
+    placed = []
+    unplaced = 0
+    for change in changes:
+        if change.record is None:
+            print(f"Skipping {change.name}: no week found (add a 'Datum: DD.MM.YYYY' line or a date to the file name)", file=sys.stderr)
+            # Not reported again until the file changes
+            index.mark_done(change)
+            unplaced += 1
+        else:
+            placed.append(change)
+
+    failed = render_weeks(args, profile, [asdict(change.record) for change in placed], layout, template_path, output_dir) if placed else []
+    for position, change in enumerate(placed):
+        if position not in failed:
+            index.mark_done(change)
+    index.save()
+    return 1 if failed or unplaced else 0
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+
+    notes_mode = args.input != "-" and Path(args.input).is_dir()
+    input_format = args.format or ("ics" if args.input.lower().endswith(".ics") else None)
+    # Timesheets are read once the calendar that numbers their weeks is known
+    timesheet_mode = input_format in ("timesheet", "ics")
+    file_profile, weeks = {}, []
+    if not notes_mode and not timesheet_mode:
+        try:
+            file_profile, weeks = read_input(args.input, args.format)
+        except (OSError, ValueError, csv.Error) as e:
+            print(f"Error reading {args.input}: {e}", file=sys.stderr)
+            return 2
+
+    # Saved configuration < input file < command line flags
+    profile = {}
+    calendar = None
+    # Dates of imported weeks are written like the dates the user entered
+    date_format = DATE_FORMATS[0]
+    if args.use_config:
+        saved = Fields()
+        # load_configuration reports on stdout, which is reserved for the generated paths
+        with contextlib.redirect_stdout(sys.stderr):
+            load_configuration(saved)
+        profile.update({name: getattr(saved, name).content for name in PROFILE_FIELDS})
+        calendar = calendar_for_week(saved.week_no.content, saved.start_date.content)
+        date_format = date_format_of(saved.start_date.content, date_format)
+    if args.training_start:
+        calendar = calendar_for_week("1", args.training_start)
+        date_format = date_format_of(args.training_start, date_format)
+        if calendar is None:
+            print(f"Error: can't read --training-start {args.training_start}", file=sys.stderr)
+            return 2
+    profile.update({name: value for name, value in file_profile.items() if value})
+    if timesheet_mode:
+        try:
+            weeks = read_timesheet(args.input, input_format, calendar, date_format)
+        except (OSError, ValueError, csv.Error) as e:
+            print(f"Error reading {args.input}: {e}", file=sys.stderr)
+            return 2
+    profile.update({name: getattr(args, name) for name in PROFILE_FIELDS if getattr(args, name)})
+
+    layout = resolve_layout(args.template)
+    template_path = layout.pdf_path
+    if args.template and args.template not in get_registry().names():
+        template_path = Path(args.template)
+    if not template_path.exists():
+        print(f"Error: Template file not found at {template_path}", file=sys.stderr)
+        return 2
+
+    output_dir = Path(args.output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    if notes_mode:
+        while True:
+            status = ingest_notes(args, profile, layout, template_path, output_dir, calendar, date_format)
+            if not args.watch:
+                return status
+            # Only the first pass re-renders everything
+            args.force = False
+            try:
+                time.sleep(args.watch)
+            except KeyboardInterrupt:
+                return status
+
+    if not weeks:
+        return 0
+
+    if args.combined:
+        return export_combined(args, profile, weeks, layout, template_path)
+    if args.archive:
+        return export_archive(args, profile, weeks, layout, template_path)
+
+    return 1 if render_weeks(args, profile, weeks, layout, template_path, output_dir) else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
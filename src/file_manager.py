@@ -1,11 +1,21 @@
 
+from contextlib import contextmanager
 from dataclasses import asdict
+import os
 import sys
 import json
+import tempfile
+import threading
 from pathlib import Path
+from typing import Dict, Optional
 from schemas import PersistedFields, Fields
 
 
+# Last configuration written to or read from each config file (see save_configuration)
+_last_persisted: Dict[Path, dict] = {}
+_persist_lock = threading.Lock()
+
+
 def get_resource_path(relative_path):
     """Get absolute path to resource, works for dev and for PyInstaller"""
     try:
@@ -18,14 +28,63 @@ def get_resource_path(relative_path):
         base_path = Path(__file__).resolve().parent
     return Path(base_path) / relative_path
 
+# Process umask, so atomically written files get the same permissions as open() would give them
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+@contextmanager
+def atomic_open(path, mode: str = "wb", encoding=None):
+    """
+    Open a temporary file next to path and rename it over path once the block succeeds.
+
+    If the block raises, the temporary file is removed and path is left untouched.
+    """
+    target = Path(path)
+    fd, temp_path = tempfile.mkstemp(dir=target.parent, prefix=f".{target.name}.", suffix=".tmp")
+    try:
+        # mkstemp creates the file as 0600
+        os.chmod(temp_path, 0o666 & ~_UMASK)
+        with os.fdopen(fd, mode, encoding=encoding) as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, target)
+    except BaseException:
+        try:
+            os.unlink(temp_path)
+        except OSError:
+            pass
+        raise
+
+DEFAULT_TEMPLATE = "assets/templates/berichtsheft_wochenlich_template.pdf"
+
+def get_template_path(relative_path: str = DEFAULT_TEMPLATE) -> Path:
+    """Get path to a bundled template, falling back to the project root when running from source"""
+    path = get_resource_path(relative_path)
+    if not path.exists():
+        project_path = Path(__file__).resolve().parent.parent / relative_path
+        if project_path.exists():
+            return project_path
+    return path
+
 def get_config_path():
     """Get path to configuration file in user's home directory"""
     config_dir = Path.home() / ".berichtsheft_generator"
     config_dir.mkdir(exist_ok=True)  # Create directory if it doesn't exist
     return config_dir / "config.json"
 
-def save_configuration(fields: Fields) -> bool:
-    """Save current field values to configuration file using typed model"""
+def _comparable(config_data: dict) -> dict:
+    """Configuration without the timestamp, used to detect whether anything changed"""
+    return {key: value for key, value in config_data.items() if key != "last_saved"}
+
+def save_configuration(fields: Fields, force: bool = False, config_path: Optional[Path] = None) -> bool:
+    """
+    Save current field values to configuration file using typed model
+
+    The file is replaced atomically. Unless force is set, nothing is written when
+    the values are the same as the last ones saved or loaded. config_path
+    defaults to the file in the user's home directory.
+    """
     try:
         # Create typed model from current fields
         persisted_fields = PersistedFields.from_fields(fields)
@@ -33,19 +92,59 @@ def save_configuration(fields: Fields) -> bool:
         # Convert to dictionary for JSON serialization
         config_data = asdict(persisted_fields)
         
-        config_path = get_config_path()
-        with open(config_path, 'w', encoding='utf-8') as f:
-            json.dump(config_data, f, indent=2, ensure_ascii=False)
+        config_path = Path(config_path) if config_path else get_config_path()
+        with _persist_lock:
+            if not force and _last_persisted.get(config_path) == _comparable(config_data):
+                return True
+            with atomic_open(config_path, 'w', encoding='utf-8') as f:
+                json.dump(config_data, f, indent=2, ensure_ascii=False)
+            _last_persisted[config_path] = _comparable(config_data)
         print(f"Configuration saved to {config_path}")
         return True
     except Exception as e:
         print(f"Error saving configuration: {e}")
         return False
 
-def load_configuration(fields: Fields) -> bool:
+class DebouncedConfigSaver:
+    """
+    Coalesces rapid save requests into a single background write.
+
+    Every schedule() restarts the delay; once no new request has arrived for
+    `delay` seconds, the latest field values are saved from a timer thread, off
+    the UI event loop. Call flush() on shutdown to write anything still pending.
+    """
+
+    def __init__(self, delay: float = 1.0, config_path: Optional[Path] = None):
+        self.delay = delay
+        self.config_path = config_path
+        self._lock = threading.Lock()
+        self._timer: Optional[threading.Timer] = None
+        self._pending: Optional[Fields] = None
+
+    def schedule(self, fields: Fields) -> None:
+        with self._lock:
+            self._pending = fields
+            if self._timer is not None:
+                self._timer.cancel()
+            self._timer = threading.Timer(self.delay, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def flush(self) -> bool:
+        """Write the pending save now, if there is one"""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            fields, self._pending = self._pending, None
+        if fields is None:
+            return True
+        return save_configuration(fields, config_path=self.config_path)
+
+def load_configuration(fields: Fields, config_path: Optional[Path] = None) -> bool:
     """Load configuration from file using typed model and apply to fields"""
     try:
-        config_path = get_config_path()
+        config_path = Path(config_path) if config_path else get_config_path()
         if not config_path.exists():
             print("No configuration file found, using defaults")
             return False
@@ -55,6 +154,8 @@ def load_configuration(fields: Fields) -> bool:
         
         # Create typed model from loaded data
         persisted_fields = PersistedFields.from_dict(config_data)
+        with _persist_lock:
+            _last_persisted[config_path] = _comparable(asdict(persisted_fields))
         
         # Apply to current fields
         persisted_fields.apply_to_fields(fields)
@@ -65,3 +166,11 @@ def load_configuration(fields: Fields) -> bool:
         print(f"Error loading configuration: {e}")
         return False
 
+
+def get_report_filename(week_no: str, start_date: str) -> str:
+    """Build the output filename for a weekly report"""
+    start_date_formatted = start_date.strip().replace("/", "_")
+    week_content = week_no.strip()
+    if week_content and week_content != "0":
+        return f"berichtsheft_w{week_content}_{start_date_formatted}.pdf"
+    return f"berichtsheft_w{start_date_formatted}.pdf"
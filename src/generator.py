@@ -1,19 +1,32 @@
-from PyPDF2 import PdfReader, PdfWriter
+from PyPDF2 import PdfReader, PdfWriter, PageObject
+from PyPDF2.generic import ArrayObject, DecodedStreamObject, DictionaryObject, IndirectObject, NameObject, RectangleObject, StreamObject
 from reportlab.pdfgen import canvas
 from reportlab.lib.pagesizes import A4
 from reportlab.lib.units import mm
 import io
-import textwrap
-from schemas import Fields
+import os
+import threading
+from functools import lru_cache
+from pathlib import Path
+from typing import BinaryIO, Callable, Dict, Iterable, Optional, Tuple
+from schemas import Fields, PROFILE_FIELDS
+from text_layout import wrap_text, fit_font_size
+from file_manager import atomic_open
+from instrumentation import span
 
+# Bump whenever the same input renders to different bytes (invalidates output caches)
+RENDERER_VERSION = 4
 
-def create_overlay(data: dict, coords: dict, font="Helvetica", font_size=12, line_spacing=14, pagesize=A4, field_max_widths=None):
+
+def create_overlay(data: dict, coords: dict, font="Helvetica", font_size=12, line_spacing=14, pagesize=A4, field_max_widths=None, field_max_heights=None, auto_fit=False):
     """
     data: dict with keys matching coords
     coords: dict {field_name: (x, y)}
     font_size: base font size
     line_spacing: vertical spacing between lines
     field_max_widths: dict {field_name: max_width_in_points} - fields that should wrap text
+    field_max_heights: dict {field_name: box_height_in_points} - box height below the first baseline
+    auto_fit: shrink font size and leading of wrapped fields until they fit field_max_heights
     """
     if field_max_widths is None:
         field_max_widths = {
@@ -23,61 +36,371 @@ def create_overlay(data: dict, coords: dict, font="Helvetica", font_size=12, lin
         }
     
     packet = io.BytesIO()
-    can = canvas.Canvas(packet, pagesize=pagesize)
+    # invariant=1 fixes the timestamps and document ID, so equal input gives equal bytes
+    can = canvas.Canvas(packet, pagesize=pagesize, invariant=1)
     can.setFont(font, font_size)
 
-    for field, (x, y) in coords.items():
-        if field not in data:
-            continue
-        value = data[field]
-        if not value:
-            continue
-
-        # Handle multi-line values with optional text wrapping
-        textobject = can.beginText(x, y)
-        textobject.setFont(font, font_size)
-        textobject.setLeading(line_spacing)
-
-        # Check if this field needs text wrapping
-        if field in field_max_widths:
-            max_width = field_max_widths[field]
-            # Estimate characters per line based on font size (rough approximation)
-            chars_per_line = int(max_width / (font_size * 0.5))  # 0.5 is approximate char width ratio
-
-            for line in str(value).split("\n"):
-                if len(line) <= chars_per_line:
+    with span("overlay.draw"):
+        for field, (x, y) in coords.items():
+            if field not in data:
+                continue
+            value = data[field]
+            if not value:
+                continue
+
+            # Handle multi-line values with optional text wrapping
+            textobject = can.beginText(x, y)
+            field_font_size, field_line_spacing = font_size, line_spacing
+
+            # Check if this field needs text wrapping
+            if field in field_max_widths:
+                max_width = field_max_widths[field]
+                if auto_fit and field_max_heights and field in field_max_heights:
+                    field_font_size, field_line_spacing = fit_font_size(
+                        str(value), max_width, field_max_heights[field], font, font_size, line_spacing
+                    )
+                textobject.setFont(font, field_font_size)
+                textobject.setLeading(field_line_spacing)
+
+                # Break lines using the real glyph widths of the font
+                for wrapped_line in wrap_text(value, max_width, font, field_font_size):
+                    textobject.textLine(wrapped_line)
+            else:
+                textobject.setFont(font, font_size)
+                textobject.setLeading(line_spacing)
+
+                # No wrapping for other fields
+                for line in str(value).split("\n"):
                     textobject.textLine(line)
-                else:
-                    # Wrap long lines
-                    wrapped_lines = textwrap.fill(line, width=chars_per_line).split('\n')
-                    for wrapped_line in wrapped_lines:
-                        textobject.textLine(wrapped_line)
-        else:
-            # No wrapping for other fields
-            for line in str(value).split("\n"):
-                textobject.textLine(line)
         
-        can.drawText(textobject)
+            can.drawText(textobject)
 
-    can.save()
+    with span("overlay.save"):
+        can.save()
     packet.seek(0)
     return packet
 
-def insert_text_on_pdf(template_path: str, output_path: str, data: dict, coords: dict, font: str = "Helvetica", font_size: int = 12, line_spacing: int = 14, field_max_widths=None):
-    reader = PdfReader(template_path)
-    writer = PdfWriter()
+def _content_bytes(page: PageObject) -> bytes:
+    """Decoded content of a page, joined if it is split into several streams"""
+    contents = page.get_contents()
+    if contents is None:
+        return b""
+    if isinstance(contents, ArrayObject):
+        return b"\n".join(part.get_object().get_data() for part in contents)
+    return contents.get_data()
 
-    overlay_pdf = PdfReader(
-        create_overlay(data, coords, font=font, font_size=font_size, line_spacing=line_spacing, field_max_widths=field_max_widths)
-    )
-    overlay_page = overlay_pdf.pages[0]
+def _compressed_stream(data: bytes, entries: dict = None) -> StreamObject:
+    """Flate-compressed stream with the given dictionary entries"""
+    stream = DecodedStreamObject()
+    stream.set_data(data)
+    # flate_encode only keeps /Filter, so the entries are added afterwards
+    stream = stream.flate_encode()
+    if entries:
+        stream.update(entries)
+    return stream
+
+
+# Names of the template form and the profile form in a report page's resources
+_TEMPLATE_FORM_NAME = NameObject("/BhTemplate")
+_PROFILE_FORM_NAME = NameObject("/BhProfile")
+
+# Page entries that still apply when the template page is drawn as a form
+_INHERITED_PAGE_KEYS = ("/CropBox", "/Rotate", "/Group", "/Tabs", "/StructParents")
+
+
+def _add_page(writer: PdfWriter, page: PageObject) -> PageObject:
+    """writer.add_page, keeping the page's /StructParents (which add_page drops)"""
+    added = writer.add_page(page)
+    if "/StructParents" in page:
+        added[NameObject("/StructParents")] = page["/StructParents"].clone(writer)
+    return added
+
+def _copy_annotations(page: PageObject, annotations, writer: PdfWriter) -> None:
+    """
+    Give page (already in writer) its own copies of annotations (links, form widgets).
+
+    The copies point their /P at page. The old /P is not followed, so the page
+    the annotations came from is not copied along; what the annotations refer
+    to (appearance streams, form fields) is shared.
+    """
+    copies = ArrayObject()
+    for annotation in annotations.get_object():
+        copy = DictionaryObject({key: value for key, value in annotation.get_object().items() if key != "/P"}).clone(writer)
+        copy[NameObject("/P")] = page.indirect_reference
+        copies.append(writer._add_object(copy))
+    page[NameObject("/Annots")] = copies
+
+
+class TemplateRenderer:
+    """
+    Reusable renderer that parses each template only once.
+
+    Each template page is turned into a form XObject, kept in an LRU cache keyed
+    by (path, mtime), so an edited template is picked up automatically while
+    repeated renders of the same template skip the PDF parsing entirely. A report
+    page only draws that form and adds the overlay as a small content stream, so
+    the template's content is never parsed or rewritten per report.
+
+    Profile fields (see schemas.PROFILE_FIELDS) never change between weeks. They are
+    drawn once per profile into a small form of their own, cached separately and
+    drawn on top of the template. Many profiles (e.g. the users of a server) share
+    the parsed template and only add their own profile form to the cache.
+
+    A renderer can be shared between threads. The cached pages read lazily from
+    their parser, so loading and copying them is serialized by a lock; drawing the
+    overlay and writing the document run in parallel.
+    """
+
+    def __init__(self, cache_size: int = 8, profile_cache_size: int = 256):
+        self._read_template = lru_cache(maxsize=cache_size)(self._read_template_bytes)
+        self._load_template = lru_cache(maxsize=cache_size)(self._parse_template)
+        self._load_page_forms = lru_cache(maxsize=cache_size)(self._build_page_forms)
+        self._load_profile_form = lru_cache(maxsize=profile_cache_size)(self._build_profile_form)
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def _read_template_bytes(path: str, mtime_ns: int) -> bytes:
+        """Read a template from disk. mtime_ns is only part of the cache key."""
+        with open(path, "rb") as f:
+            return f.read()
+
+    def _parse_template(self, path: str, mtime_ns: int) -> Tuple[PageObject, ...]:
+        """Parse a template"""
+        reader = PdfReader(io.BytesIO(self._read_template(path, mtime_ns)))
+        # Touch every page so the page tree is resolved up front
+        return tuple(reader.pages)
+
+    def get_template_pages(self, template_path: str) -> Tuple[PageObject, ...]:
+        """Return the parsed pages of a template, loading them on first use."""
+        path = str(Path(template_path).resolve())
+        with self._lock:
+            return self._load_template(path, os.stat(path).st_mtime_ns)
 
-    for page in reader.pages:
-        page.merge_page(overlay_page)
-        writer.add_page(page)
+    def _build_page_forms(self, path: str, mtime_ns: int) -> Tuple[PageObject, ...]:
+        """
+        Build one blank page per template page that draws the template page as a form XObject.
 
-    with open(output_path, "wb") as f:
-        writer.write(f)
+        The pages have no /Contents yet; compose adds a copy to its writer and
+        attaches the overlay. Copies made into the same writer share one form.
+        The template page's annotations are kept on the form page.
+        """
+        writer = PdfWriter()
+        for page in self._load_template(path, mtime_ns):
+            media_box = RectangleObject(page.mediabox)
+            form = _compressed_stream(_content_bytes(page), {
+                NameObject("/Type"): NameObject("/XObject"),
+                NameObject("/Subtype"): NameObject("/Form"),
+                NameObject("/BBox"): media_box,
+                NameObject("/Resources"): page[NameObject("/Resources")].get_object().clone(writer),
+            })
+            form_page = PageObject.create_blank_page(None, media_box.width, media_box.height)
+            form_page[NameObject("/MediaBox")] = media_box
+            for key in _INHERITED_PAGE_KEYS:
+                if key in page:
+                    form_page[NameObject(key)] = page[key].clone(writer)
+            form_page[NameObject("/Resources")] = DictionaryObject({
+                NameObject("/XObject"): DictionaryObject({_TEMPLATE_FORM_NAME: writer._add_object(form)}),
+            })
+            form_page = _add_page(writer, form_page)
+            if "/Annots" in page:
+                _copy_annotations(form_page, page["/Annots"], writer)
 
-    with open(output_path, "wb") as f:
-        writer.write(f)
\ No newline at end of file
+        buffer = io.BytesIO()
+        writer.write(buffer)
+        return tuple(PdfReader(buffer).pages)
+
+    def get_page_forms(self, template_path: str) -> Tuple[PageObject, ...]:
+        """Return the template's form pages (see _build_page_forms), building them on first use."""
+        path = str(Path(template_path).resolve())
+        with self._lock:
+            return self._load_page_forms(path, os.stat(path).st_mtime_ns)
+
+    @staticmethod
+    def _build_profile_form(static_layer: tuple, font: str = "Helvetica", font_size: int = 12, line_spacing: int = 14) -> Optional[StreamObject]:
+        """
+        Draw the static layer into a form XObject; None if there is nothing to draw.
+
+        static_layer: tuple of (field_name, value, (x, y)) entries
+        """
+        if not static_layer:
+            return None
+        data = {name: value for name, value, _ in static_layer}
+        coords = {name: xy for name, _, xy in static_layer}
+        packet = create_overlay(data, coords, font=font, font_size=font_size, line_spacing=line_spacing, field_max_widths={})
+        page = PdfReader(packet).pages[0]
+        return _compressed_stream(_content_bytes(page), {
+            NameObject("/Type"): NameObject("/XObject"),
+            NameObject("/Subtype"): NameObject("/Form"),
+            NameObject("/BBox"): RectangleObject(page.mediabox),
+            NameObject("/Resources"): page[NameObject("/Resources")].get_object(),
+        })
+
+    def get_profile_form(self, static_layer: tuple, font: str = "Helvetica", font_size: int = 12, line_spacing: int = 14) -> Optional[StreamObject]:
+        """Return the form that draws a static layer (see _build_profile_form), building it on first use."""
+        with self._lock:
+            return self._load_profile_form(static_layer, font, font_size, line_spacing)
+
+    def clear_cache(self) -> None:
+        with self._lock:
+            self._read_template.cache_clear()
+            self._load_template.cache_clear()
+            self._load_page_forms.cache_clear()
+            self._load_profile_form.cache_clear()
+
+    @staticmethod
+    def split_static_layer(data: dict, coords: dict) -> Tuple[tuple, dict]:
+        """Split data into a hashable static layer and the remaining per-week data."""
+        static_layer = tuple(
+            (name, data[name], tuple(coords[name]))
+            for name in PROFILE_FIELDS
+            if data.get(name) and name in coords
+        )
+        dynamic_data = {name: value for name, value in data.items() if name not in PROFILE_FIELDS}
+        return static_layer, dynamic_data
+
+    def _add_report_pages(self, writer: PdfWriter, template_path: str, data: dict, coords: dict, font: str, font_size: int, line_spacing: int, field_max_widths, field_max_heights, auto_fit: bool, shared_resources: Optional[dict] = None) -> None:
+        """
+        Add one report (one page per template page) to writer.
+
+        shared_resources maps overlay resources already added to writer to their
+        object, so a document with many reports stores each font once.
+        """
+        static_layer, dynamic_data = self.split_static_layer(data, coords)
+
+        with span("overlay"):
+            overlay_packet = create_overlay(dynamic_data, coords, font=font, font_size=font_size, line_spacing=line_spacing, field_max_widths=field_max_widths, field_max_heights=field_max_heights, auto_fit=auto_fit)
+            with span("overlay.parse"):
+                overlay_page = PdfReader(overlay_packet).pages[0]
+                overlay_resources = overlay_page[NameObject("/Resources")].get_object()
+                overlay_content = _content_bytes(overlay_page)
+
+        with self._lock:
+            with span("template"):
+                form_pages = self.get_page_forms(template_path)
+                profile_form = self.get_profile_form(static_layer, font, font_size, line_spacing)
+
+            with span("merge"):
+                # The template's and the profile's resources live inside their forms, so the overlay keeps its own names
+                drawing = b"q " + _TEMPLATE_FORM_NAME.encode() + b" Do Q\n"
+                if profile_form is not None:
+                    drawing += b"q " + _PROFILE_FORM_NAME.encode() + b" Do Q\n"
+                    profile_key = ("profile", static_layer, font, font_size, line_spacing)
+                    profile_reference = None if shared_resources is None else shared_resources.get(profile_key)
+                    if profile_reference is None:
+                        profile_reference = writer._add_object(profile_form.clone(writer))
+                        if shared_resources is not None:
+                            shared_resources[profile_key] = profile_reference
+                content = _compressed_stream(drawing + overlay_content)
+
+                for form_page in form_pages:
+                    page = _add_page(writer, form_page)
+                    if "/Annots" in page and shared_resources is not None:
+                        # Further reports in writer would share the first one's annotations
+                        _copy_annotations(page, page["/Annots"], writer)
+                    resources = page[NameObject("/Resources")]
+                    if profile_form is not None:
+                        xobjects = DictionaryObject(resources.get("/XObject", DictionaryObject()))
+                        xobjects[_PROFILE_FORM_NAME] = profile_reference
+                        resources[NameObject("/XObject")] = xobjects
+                    for category, entries in overlay_resources.items():
+                        entries = entries.get_object()
+                        if not isinstance(entries, DictionaryObject):
+                            resources[NameObject(category)] = entries.clone(writer)
+                            continue
+                        merged = DictionaryObject(resources.get(category, DictionaryObject()))
+                        for name, value in entries.items():
+                            value = value.get_object()
+                            if shared_resources is None:
+                                merged[NameObject(name)] = writer._add_object(value.clone(writer))
+                                continue
+                            key = (category, name, repr(value))
+                            if key not in shared_resources:
+                                shared_resources[key] = writer._add_object(value.clone(writer))
+                            merged[NameObject(name)] = shared_resources[key]
+                        resources[NameObject(category)] = merged
+                    page[NameObject("/Contents")] = writer._add_object(content)
+
+    def compose(self, template_path: str, data: dict, coords: dict, font: str = "Helvetica", font_size: int = 12, line_spacing: int = 14, field_max_widths=None, field_max_heights=None, auto_fit: bool = False) -> PdfWriter:
+        """Overlay data onto the template and return the finished (unwritten) document."""
+        writer = PdfWriter()
+        self._add_report_pages(writer, template_path, data, coords, font, font_size, line_spacing, field_max_widths, field_max_heights, auto_fit)
+        return writer
+
+    def render_combined(self, template_path: str, stream: BinaryIO, pages_data: Iterable[dict], coords: dict, font: str = "Helvetica", font_size: int = 12, line_spacing: int = 14, field_max_widths=None, field_max_heights=None, auto_fit: bool = False, progress: Optional[Callable[[int], None]] = None) -> int:
+        """
+        Render one report per entry of pages_data into a single PDF written to stream.
+
+        The template (with its static layer) is stored once as a form XObject that
+        every page draws, and overlay fonts are shared between pages, so each week
+        only adds its own compressed overlay stream. pages_data is consumed lazily
+        and every overlay is discarded once its page is added, so memory grows with
+        the size of the output only. progress is called with the number of pages
+        done. Returns the number of weeks rendered.
+        """
+        writer = PdfWriter()
+        shared_resources: Dict[tuple, IndirectObject] = {}
+        count = 0
+        for data in pages_data:
+            self._add_report_pages(writer, template_path, data, coords, font, font_size, line_spacing, field_max_widths, field_max_heights, auto_fit, shared_resources)
+            count += 1
+            if progress is not None:
+                progress(count)
+
+        with span("write"):
+            writer.write(stream)
+        return count
+
+    def render_to_stream(self, template_path: str, stream: BinaryIO, data: dict, coords: dict, **options) -> None:
+        """Render the PDF into any writable binary file-like object. options are passed to compose."""
+        writer = self.compose(template_path, data, coords, **options)
+        with span("write"):
+            writer.write(stream)
+
+    def render_to_bytes(self, template_path: str, data: dict, coords: dict, **options) -> bytes:
+        """Render the PDF in memory and return its bytes. options are passed to compose."""
+        buffer = io.BytesIO()
+        self.render_to_stream(template_path, buffer, data, coords, **options)
+        return buffer.getvalue()
+
+    def render(self, template_path: str, output_path: str, data: dict, coords: dict, **options) -> None:
+        """
+        Render the PDF to output_path. options are passed to compose.
+
+        The file is written to a temporary file next to output_path and renamed into
+        place, so readers never see a half-written report.
+        """
+        writer = self.compose(template_path, data, coords, **options)
+        with span("write"), atomic_open(output_path) as f:
+            writer.write(f)
+
+
+# Shared renderer used by the module-level helpers
+default_renderer = TemplateRenderer()
+
+def insert_text_on_pdf(template_path: str, output_path: str, data: dict, coords: dict, font: str = "Helvetica", font_size: int = 12, line_spacing: int = 14, field_max_widths=None, field_max_heights=None, auto_fit: bool = False):
+    default_renderer.render(
+        template_path,
+        output_path,
+        data,
+        coords,
+        font=font,
+        font_size=font_size,
+        line_spacing=line_spacing,
+        field_max_widths=field_max_widths,
+        field_max_heights=field_max_heights,
+        auto_fit=auto_fit,
+    )
+
+def insert_text_on_pdf_bytes(template_path: str, data: dict, coords: dict, font: str = "Helvetica", font_size: int = 12, line_spacing: int = 14, field_max_widths=None, field_max_heights=None, auto_fit: bool = False) -> bytes:
+    """Same as insert_text_on_pdf, but returns the PDF as bytes instead of writing a file"""
+    return default_renderer.render_to_bytes(
+        template_path,
+        data,
+        coords,
+        font=font,
+        font_size=font_size,
+        line_spacing=line_spacing,
+        field_max_widths=field_max_widths,
+        field_max_heights=field_max_heights,
+        auto_fit=auto_fit,
+    )
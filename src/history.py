@@ -0,0 +1,121 @@
+"""
+Local history of every week's report content.
+
+Weeks are stored in a SQLite database (WAL mode) next to config.json, keyed by
+the Monday of the week, so going back to a week restores what was typed for it.
+"""
+import sqlite3
+import threading
+from dataclasses import replace
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Iterable, List, Optional
+from schemas import Fields, WeekRecord, PROFILE_FIELDS
+from training_calendar import parse_date
+
+
+WEEK_COLUMNS = ('week_no', 'start_date', 'end_date', 'texts_1', 'hour_1', 'texts_2', 'hour_2', 'texts_3', 'hour_3')
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS weeks (
+    week_start TEXT PRIMARY KEY,  -- ISO date of the week's Monday
+    {', '.join(f"{column} TEXT NOT NULL DEFAULT ''" for column in WEEK_COLUMNS + PROFILE_FIELDS)},
+    updated_at TEXT NOT NULL
+);
+"""
+
+
+def get_history_path() -> Path:
+    """Get path to the history database in user's home directory"""
+    history_dir = Path.home() / ".berichtsheft_generator"
+    history_dir.mkdir(exist_ok=True)
+    return history_dir / "history.sqlite3"
+
+
+def week_key(date_str: str) -> Optional[str]:
+    """ISO date of the Monday of the week containing date_str"""
+    parsed = parse_date(date_str)
+    if parsed is None:
+        return None
+    return (parsed - timedelta(days=parsed.weekday())).isoformat()
+
+
+class HistoryStore:
+    """SQLite backed store of all weeks' field data"""
+
+    def __init__(self, path: Optional[Path] = None):
+        self.path = Path(path) if path else get_history_path()
+        # One connection shared between the UI and background threads, guarded by a lock
+        self._connection = sqlite3.connect(self.path, check_same_thread=False)
+        self._connection.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock, self._connection:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("PRAGMA synchronous=NORMAL")
+            self._connection.executescript(SCHEMA)
+
+    def save_week(self, fields: Fields) -> bool:
+        """Insert or update the week shown in fields. Returns False if it has no valid start date."""
+        return self.save_records([WeekRecord.from_fields(fields)], fields) == 1
+
+    def save_records(self, records: Iterable[WeekRecord], profile: Fields) -> int:
+        """Insert or update many weeks in one transaction, with the profile values of profile. Returns the number saved."""
+        profile_values = [getattr(profile, name).content for name in PROFILE_FIELDS]
+        columns = list(WEEK_COLUMNS + PROFILE_FIELDS)
+        now = datetime.now().isoformat()
+        rows = []
+        for record in records:
+            key = week_key(record.start_date)
+            if key is not None:
+                rows.append((key, *(getattr(record, column) for column in WEEK_COLUMNS), *profile_values, now))
+        if not rows:
+            return 0
+
+        with self._lock, self._connection:
+            self._connection.executemany(
+                f"INSERT INTO weeks (week_start, {', '.join(columns)}, updated_at) "
+                f"VALUES (?, {', '.join('?' for _ in columns)}, ?) "
+                f"ON CONFLICT (week_start) DO UPDATE SET "
+                f"{', '.join(f'{column} = excluded.{column}' for column in columns)}, updated_at = excluded.updated_at",
+                rows,
+            )
+        return len(rows)
+
+    def merge_saved(self, records: Iterable[WeekRecord]) -> List[WeekRecord]:
+        """
+        records, with what is already saved for their weeks kept.
+
+        A section (text and hours) is only taken from a record if the saved week
+        has no text for it, so an import does not overwrite what the user typed.
+        """
+        merged = []
+        for record in records:
+            saved = self.load_week(record.start_date)
+            if saved is None:
+                merged.append(record)
+                continue
+            record = replace(record, week_no=saved.week_no or record.week_no)
+            for index in (1, 2, 3):
+                if getattr(saved, f"texts_{index}").strip():
+                    record = replace(record, **{f"texts_{index}": getattr(saved, f"texts_{index}"), f"hour_{index}": getattr(saved, f"hour_{index}")})
+            merged.append(record)
+        return merged
+
+    def load_week(self, start_date: str) -> Optional[WeekRecord]:
+        """Return the saved content of the week containing start_date, if any"""
+        key = week_key(start_date)
+        if key is None:
+            return None
+        with self._lock:
+            row = self._connection.execute("SELECT * FROM weeks WHERE week_start = ?", (key,)).fetchone()
+        return WeekRecord.from_dict(dict(row)) if row else None
+
+    def all_weeks(self) -> List[WeekRecord]:
+        """All saved weeks in chronological order"""
+        with self._lock:
+            rows = self._connection.execute("SELECT * FROM weeks ORDER BY week_start").fetchall()
+        return [WeekRecord.from_dict(dict(row)) for row in rows]
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
@@ -0,0 +1,127 @@
+"""
+Optional timing and profiling hooks for PDF generation.
+
+The generator wraps each stage in `span(name)`. Spans are only recorded inside a
+`record_timings()` block, otherwise they cost next to nothing:
+
+    with record_timings() as timings:
+        insert_text_on_pdf(...)
+    print(timings.to_json())
+
+`capture_profile()` runs a block under cProfile for a closer look at a single generation.
+"""
+import cProfile
+import io
+import json
+import pstats
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, asdict
+from typing import List, Optional
+
+
+@dataclass
+class Span:
+    """One timed stage; depth is the nesting level (0 = top level)"""
+    name: str
+    start_ms: float
+    duration_ms: float = 0.0
+    depth: int = 0
+
+
+class Timings:
+    """Collects spans in the order they were started"""
+
+    def __init__(self):
+        self.spans: List[Span] = []
+        self._origin = time.perf_counter()
+        self._depth = 0
+
+    @contextmanager
+    def span(self, name: str):
+        start = time.perf_counter()
+        entry = Span(name, (start - self._origin) * 1000, depth=self._depth)
+        self.spans.append(entry)
+        self._depth += 1
+        try:
+            yield entry
+        finally:
+            self._depth -= 1
+            entry.duration_ms = (time.perf_counter() - start) * 1000
+
+    @property
+    def total_ms(self) -> float:
+        return sum(span.duration_ms for span in self.spans if span.depth == 0)
+
+    def as_dict(self) -> dict:
+        return {
+            "total_ms": round(self.total_ms, 3),
+            "spans": [
+                {**asdict(span), "start_ms": round(span.start_ms, 3), "duration_ms": round(span.duration_ms, 3)}
+                for span in self.spans
+            ],
+        }
+
+    def to_json(self, indent: Optional[int] = 2) -> str:
+        return json.dumps(self.as_dict(), indent=indent)
+
+    def summary(self) -> str:
+        """Human readable, indented list of spans"""
+        return "\n".join(
+            f"{'  ' * span.depth}{span.name}: {span.duration_ms:.1f} ms"
+            for span in self.spans
+        )
+
+
+_current_timings: ContextVar[Optional[Timings]] = ContextVar("current_timings", default=None)
+
+
+@contextmanager
+def record_timings():
+    """Record the spans of everything run inside the block"""
+    timings = Timings()
+    token = _current_timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _current_timings.reset(token)
+
+
+@contextmanager
+def span(name: str):
+    """Time a stage if timings are being recorded, otherwise do nothing"""
+    timings = _current_timings.get()
+    if timings is None:
+        yield None
+        return
+    with timings.span(name) as entry:
+        yield entry
+
+
+class ProfileCapture:
+    """cProfile results of a capture_profile() block"""
+
+    def __init__(self, profiler: cProfile.Profile):
+        self.profiler = profiler
+
+    def stats_text(self, limit: int = 30, sort: str = "cumulative") -> str:
+        stream = io.StringIO()
+        pstats.Stats(self.profiler, stream=stream).sort_stats(sort).print_stats(limit)
+        return stream.getvalue()
+
+    def dump(self, path: str) -> None:
+        """Write the raw stats, e.g. for snakeviz or pstats"""
+        self.profiler.dump_stats(path)
+
+
+@contextmanager
+def capture_profile():
+    """Run the block under cProfile"""
+    profiler = cProfile.Profile()
+    capture = ProfileCapture(profiler)
+    profiler.enable()
+    try:
+        yield capture
+    finally:
+        profiler.disable()
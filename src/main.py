@@ -1,18 +1,35 @@
 from pathlib import Path
-from schemas import Fields
-from generator import insert_text_on_pdf
-from nicegui import ui, native
-from datetime import datetime, timedelta
+import argparse
+import csv
+import io
+import os
+import secrets
+import threading
+import time
+import weakref
+from urllib.parse import urlencode
+from fastapi import HTTPException, Request
+from fastapi.responses import StreamingResponse
+from schemas import WeekRecord
+from nicegui import app, ui, native, run
 from multiprocessing import freeze_support  # noqa
 freeze_support()  # noqa
-from file_manager import save_configuration, load_configuration, get_resource_path
+from file_manager import get_report_filename
+from training_calendar import compute_end_date_from_start, get_week_dates, calendar_for_week, parse_date, sign_date_for, date_format_of, format_date
+from text_layout import wrap_text, fits_box, fit_font_size
+from template_registry import default_layout
+from sessions import SessionStore, UserSession, LOCAL_USER
 from sys import exit
 
-# Global fields instance for the UI
-fields = Fields()
+# Fields, history, activity index and settings of every user; the desktop app has only one.
+# main() replaces it with a store below --data-dir in server mode.
+sessions = SessionStore()
+
+# Session of the user each connected browser tab belongs to (server mode)
+client_sessions = weakref.WeakKeyDictionary()
 
 BASE_DIR = Path(__file__).resolve().parent
-TEMPLATE_PATH = get_resource_path("assets/templates/berichtsheft_wochenlich_template.pdf")
+TEMPLATE_PATH = default_layout().pdf_path
 
 # Verify template exists
 if not TEMPLATE_PATH.exists():
@@ -21,167 +38,461 @@ if not TEMPLATE_PATH.exists():
 
 
 
-def compute_end_date_from_start(start_date_str: str) -> str:
+def current_session() -> UserSession:
+    """Session of the user whose page the current UI code runs for"""
+    if not sessions.multi_user:
+        return sessions.get(LOCAL_USER)
+    return client_sessions[ui.context.client]
+
+def load_generator():
     """
-    Compute end date (Friday) from start date (Monday).
-    Supports formats: DD/MM/YYYY, DD-MM-YYYY, DD.MM.YYYY
+    Import the PDF stack (PyPDF2 + reportlab) on first use.
+
+    It is not needed to show the window, so it is kept out of the module imports.
     """
-    if not start_date_str.strip():
-        return ""
-    
+    import generator
+    return generator
+
+def warm_up_pdf_stack():
+    """Import the PDF stack and parse the template in the background while the UI renders"""
     try:
-        # Try different date formats
-        formats = ["%d/%m/%Y", "%d-%m-%Y", "%d.%m.%Y"]
-        start_date = None
-        
-        for fmt in formats:
-            try:
-                start_date = datetime.strptime(start_date_str.strip(), fmt)
-                break
-            except ValueError:
-                continue
-        
-        if start_date is None:
-            return ""  # Could not parse date
-        
-        # Add 4 days to get from Monday to Friday (Monday + 4 days = Friday)
-        end_date = start_date + timedelta(days=4)
-        
-        # Return in the same format as input (detect by separator)
-        if "/" in start_date_str:
-            return end_date.strftime("%d/%m/%Y")
-        elif "-" in start_date_str:
-            return end_date.strftime("%d-%m-%Y")
+        start = time.perf_counter()
+        generator = load_generator()
+        imported = time.perf_counter()
+
+        generator.default_renderer.get_page_forms(str(TEMPLATE_PATH))
+        if not sessions.multi_user:
+            # The desktop user's profile is known already, so its static layer can be prepared too
+            fields = sessions.get(LOCAL_USER).fields
+            static_layer, _ = generator.default_renderer.split_static_layer(fields.as_data(), fields.as_coords())
+            options = fields.render_options()
+            generator.default_renderer.get_profile_form(static_layer, options['font'], options['font_size'], options['line_spacing'])
+        parsed = time.perf_counter()
+
+        print(f"PDF stack imported in {(imported - start) * 1000:.0f} ms, template parsed in {(parsed - imported) * 1000:.0f} ms")
+    except Exception as e:
+        # Generation will import and parse on demand instead
+        print(f"Error warming up PDF generator: {e}")
+
+def start_warm_up():
+    threading.Thread(target=warm_up_pdf_stack, name="pdf-warm-up", daemon=True).start()
+
+# Past activities shown per search
+RESULT_LIMIT = 8
+
+def create_activity_search(textareas: dict):
+    """Search box over past activity lines; results can be added to any of the textareas"""
+    activity_index = current_session().activity_index
+    search_input = ui.input('Search past activities', placeholder='e.g. LF5 Datenbank').props('clearable').style('width: 100%')
+    # Searched once per keystroke; the results and the autocomplete share it
+    state = {'results': []}
+
+    @ui.refreshable
+    def results_view():
+        query = search_input.value or ''
+        if not query.strip():
+            return
+        results = state['results'][:RESULT_LIMIT]
+        if not results:
+            ui.label('No matching activities').classes('text-caption text-grey')
+        for line in results:
+            with ui.row().style('width: 100%; align-items: center; gap: 0.25rem; flex-wrap: nowrap'):
+                ui.label(line).style('flex: 1')
+                for label, textarea in textareas.items():
+                    def add_line(textarea=textarea, line=line):
+                        current = (textarea.value or '').rstrip('\n')
+                        textarea.value = f'{current}\n{line}' if current else line
+                    ui.button(label, on_click=add_line).props('size=xs flat dense')
+
+    def on_search(_=None):
+        query = search_input.value or ''
+        # One more than shown, suggest drops the line that is typed out already
+        state['results'] = activity_index.search(query, RESULT_LIMIT + 1) if query.strip() else []
+        search_input.set_autocomplete(activity_index.suggest(query, RESULT_LIMIT, state['results']))
+        results_view.refresh()
+
+    search_input.on_value_change(on_search)
+    results_view()
+
+def create_diagnostics_view(diagnostics: dict):
+    """Timings (and optional cProfile output) of the last generated PDF; returns the function that redraws them"""
+    @ui.refreshable
+    def diagnostics_view():
+        ui.checkbox('Profile next generation').bind_value(diagnostics, 'profile_next')
+        if diagnostics['timings']:
+            ui.code(diagnostics['timings'], language='text').style('width: 100%')
         else:
-            return end_date.strftime("%d.%m.%Y")
-            
-    except Exception:
-        return ""  # Return empty string if any error occurs
+            ui.label('Generate a PDF to see where the time goes.').classes('text-caption text-grey')
+        if diagnostics['profile']:
+            ui.code(diagnostics['profile'], language='text').style('width: 100%')
+
+    diagnostics_view()
+    return diagnostics_view.refresh
 
-def get_week_dates(base_date_str: str, weeks_offset: int) -> tuple[str, str]:
+def render_report(output_file_path: Path, data: dict, coords: dict, options: dict, inputs: dict, profile_next: bool):
     """
-    Get Monday and Friday dates for a week relative to base_date.
-    
-    Args:
-        base_date_str: Current date string in any supported format
-        weeks_offset: Number of weeks to add/subtract (negative for previous weeks)
-    
-    Returns:
-        Tuple of (monday_str, friday_str) in the same format as input
+    Render one report unless it is up to date; runs on a worker thread.
+
+    Returns (timings, cProfile output or None), or None if the existing file was current.
     """
-    try:
-        if not base_date_str.strip():
-            # If no base date, use current date
-            base_date = datetime.now()
-            format_str = "%d/%m/%Y"
-        else:
-            # Parse the base date
-            formats = ["%d/%m/%Y", "%d-%m-%Y", "%d.%m.%Y"]
-            base_date = None
-            format_str = "%d/%m/%Y"  # Default format
-            
-            for fmt in formats:
-                try:
-                    base_date = datetime.strptime(base_date_str.strip(), fmt)
-                    format_str = fmt
-                    break
-                except ValueError:
-                    continue
-            
-            if base_date is None:
-                return "", ""
-        
-        # Find the Monday of the base week
-        days_since_monday = base_date.weekday()  # Monday is 0, Sunday is 6
-        current_monday = base_date - timedelta(days=days_since_monday)
-        
-        # Calculate the target week's Monday
-        target_monday = current_monday + timedelta(weeks=weeks_offset)
-        target_friday = target_monday + timedelta(days=4)
-        
-        # Format dates
-        monday_str = target_monday.strftime(format_str)
-        friday_str = target_friday.strftime(format_str)
-        
-        return monday_str, friday_str
-        
-    except Exception:
-        return "", ""
+    from batch import render_report_file
+    from output_cache import OutputCache, render_key
 
-def set_default_values():
-    """Set default values for the fields"""
-    # Try to load saved configuration first
-    config_loaded = load_configuration(fields)
-    
-    # Only set defaults if no configuration was loaded
-    if not config_loaded:
-        fields.ausbildung_jahr.content = "2"
-        fields.hour_1.content = "40"
+    cache = OutputCache(output_file_path.parent)
+    key = render_key(str(TEMPLATE_PATH), data, coords, **options)
+    if cache.is_current(output_file_path.name, key):
+        return None
+
+    # Timings are recorded where the report is rendered, in the shared pool on a server
+    timings, profile = render_report_file(str(TEMPLATE_PATH), str(output_file_path), data, coords, options, profile=profile_next)
 
-def generate_pdf():
-    """Generate the PDF with current field values"""
+    cache.record(output_file_path.name, key, inputs)
+    cache.save()
+    return timings, profile
+
+async def generate_pdf(refresh_diagnostics=None):
+    """Generate the PDF with current field values, without blocking the UI; refresh_diagnostics redraws the timings"""
+    session = current_session()
+    fields = session.fields
+    diagnostics = session.diagnostics
     try:
         # Auto-compute end date from start date if end date is empty
         if fields.start_date.content.strip() and not fields.end_date.content.strip():
             fields.end_date.content = compute_end_date_from_start(fields.start_date.content)
         
-        # Computed Fields
-        fields.date_of_sign.content = fields.end_date.content
-        fields.date_of_sign_2.content = fields.end_date.content
+        # Computed Fields: signed on the last workday of the week
+        fields.date_of_sign.content = sign_date_for(fields.end_date.content)
+        fields.date_of_sign_2.content = fields.date_of_sign.content
         
         # Check if start_date is empty and provide a fallback
         if not fields.start_date.content.strip():
             ui.notify('Please enter a start date before generating PDF', type='warning')
             return
             
-        start_date_formatted = fields.start_date.content.replace("/", "_")
-        
         # Build filename with optional week number
-        week_content = fields.week_no.content.strip()
-        if week_content and week_content != "0":
-            filename = f"berichtsheft_w{week_content}_{start_date_formatted}.pdf"
-        else:
-            filename = f"berichtsheft_w{start_date_formatted}.pdf"
+        filename = get_report_filename(fields.week_no.content, fields.start_date.content)
         
-        # Create output directory if it doesn't exist (now configurable)
-        output_dir = Path(fields.output_directory.content)
-        output_dir.mkdir(parents=True, exist_ok=True)
-        output_file_path = output_dir / filename
-
-        insert_text_on_pdf(
-            str(TEMPLATE_PATH),
-            str(output_file_path),
+        # Create output directory if it doesn't exist (configurable, except in server mode)
+        session.output_dir.mkdir(parents=True, exist_ok=True)
+        output_file_path = session.output_path(filename)
+
+        from output_cache import report_inputs
+
+        # Take a snapshot, the form stays editable while the PDF is rendered
+        options = fields.render_options()
+        # Saved now, so the week is stored as it was generated even if the user moves on meanwhile
+        session.config_saver.schedule(fields)
+        session.remember_week(force=True)
+
+        rendered = await run.io_bound(
+            render_report,
+            output_file_path,
             fields.as_data(),
             fields.as_coords(),
-            font_size=12,
-            line_spacing=14,
-            field_max_widths=fields.get_text_wrapping_fields()
+            options,
+            report_inputs(fields),
+            diagnostics['profile_next'],
         )
+        if rendered is None:
+            ui.notify(f'PDF is already up to date: {output_file_path}', type='info')
+            offer_download(output_file_path)
+            return
+
+        timings, profile = rendered
+        diagnostics['timings'] = timings.summary() + f"\ntotal: {timings.total_ms:.1f} ms"
+        if profile is not None:
+            diagnostics['profile'] = profile
+            diagnostics['profile_next'] = False
+        if refresh_diagnostics is not None:
+            refresh_diagnostics()
         
         ui.notify(f'PDF generated successfully: {output_file_path}', type='positive')
-        
-        # Auto-save configuration after successful PDF generation
-        save_configuration(fields)
-        
+        offer_download(output_file_path)
+
     except Exception as e:
         ui.notify(f'Error generating PDF: {str(e)}', type='negative')
 
+def offer_download(path: Path):
+    """In server mode the PDFs stay on the server, so the browser downloads what was generated"""
+    if sessions.multi_user:
+        ui.download(path)
+
+async def run_batch_with_progress(render, progress_bar, status_label, *args):
+    """Run a batch function from batch.py off the event loop, showing its progress"""
+    state = {'done': 0, 'total': 0}
+
+    def on_progress(done: int, total: int):
+        state['done'] = done
+        state['total'] = total
+
+    def refresh_progress():
+        progress_bar.value = state['done'] / state['total'] if state['total'] else 0
+        status_label.text = f"{state['done']} / {state['total']} reports"
+
+    timer = ui.timer(0.2, refresh_progress)
+    try:
+        return await run.io_bound(render, *args, progress=on_progress)
+    finally:
+        timer.cancel()
+        refresh_progress()
+
+def notify_batch_result(result, generated_label: str = 'generated'):
+    unchanged = f', {len(result.skipped)} unchanged' if result.skipped else ''
+    if result.failed:
+        ui.notify(f'{len(result.generated)} PDFs {generated_label}{unchanged}, {len(result.failed)} failed', type='warning')
+    else:
+        ui.notify(f'{len(result.generated)} PDFs {generated_label}{unchanged} in {current_session().output_dir}', type='positive')
+
+def batch_records(fields, first_date: str, last_date: str, first_week: str) -> list:
+    """One record per week in the given date range, with the activities in fields for every week"""
+    from batch import build_week_records
+
+    first_week_no = int(first_week) if first_week.strip().isdigit() else 1
+    return build_week_records(first_date, last_date, first_week_no, template=WeekRecord.from_fields(fields))
+
+async def generate_batch(first_date: str, last_date: str, first_week: str, progress_bar, status_label, export: str = 'files'):
+    """
+    Generate one PDF per week in the given date range, using the current activities for every week.
+
+    export 'combined' puts all weeks into a single PDF instead, 'archive' into a ZIP archive of weekly PDFs.
+    """
+    from batch import MAX_BATCH_WEEKS
+
+    records = batch_records(current_session().fields, first_date, last_date, first_week)
+    if not records:
+        ui.notify(f'Please enter a valid date range of at most {MAX_BATCH_WEEKS} weeks', type='warning')
+        return
+    await generate_records(records, progress_bar, status_label, export)
+
+async def import_timesheet_file(upload, progress_bar, status_label, export: str = 'files'):
+    """Turn an uploaded CSV timesheet or ICS calendar export into weeks and generate them"""
+    from timesheets import import_timesheet
+
+    session = current_session()
+    fields = session.fields
+    calendar = calendar_for_week(fields.week_no.content, fields.start_date.content)
+    input_format = 'ics' if upload.name.lower().endswith('.ics') else 'timesheet'
+    try:
+        text = io.TextIOWrapper(upload.content, encoding='utf-8-sig', newline='')
+        result = await run.io_bound(import_timesheet, text, input_format, calendar, date_format_of(fields.start_date.content))
+    except (ValueError, csv.Error, UnicodeDecodeError) as e:
+        ui.notify(f'Error importing {upload.name}: {str(e)}', type='negative')
+        return
+    records = result.records()
+    if result.skipped:
+        lines = ', '.join(map(str, result.skipped[:5])) + (', ...' if len(result.skipped) > 5 else '')
+        ui.notify(f'{len(result.skipped)} rows without a date or hours skipped (lines {lines})', type='warning')
+    if not records:
+        ui.notify(f'No entries with a date and hours found in {upload.name}', type='warning')
+        return
+
+    # Keep the imported weeks for editing in the form and for activity search,
+    # without overwriting what was already typed for them (including the week shown)
+    session.remember_week()
+    records = session.history.merge_saved(records)
+    session.history.save_records(records, fields)
+    session.activity_index.add_records(records)
+    ui.notify(f'{len(records)} weeks imported from {upload.name}', type='info')
+    await generate_records(records, progress_bar, status_label, export)
+
+async def generate_records(records: list, progress_bar, status_label, export: str = 'files'):
+    """Generate records as one PDF each, one combined PDF ('combined') or a ZIP archive ('archive')"""
+    from batch import render_batch, export_combined, get_combined_filename, export_archive, get_archive_filename
+
+    session = current_session()
+    fields = session.fields
+    if export == 'archive':
+        try:
+            output_path = session.output_path(get_archive_filename(records))
+            count = await run_batch_with_progress(export_archive, progress_bar, status_label, records, fields, str(TEMPLATE_PATH), str(output_path))
+        except Exception as e:
+            ui.notify(f'Error exporting archive: {str(e)}', type='negative')
+            return
+        ui.notify(f'{count} weeks exported to {output_path}', type='positive')
+        offer_download(output_path)
+        return
+
+    if export == 'combined':
+        try:
+            output_path = session.output_path(get_combined_filename(records))
+            pages = await run_batch_with_progress(export_combined, progress_bar, status_label, records, fields, str(TEMPLATE_PATH), str(output_path))
+        except Exception as e:
+            ui.notify(f'Error exporting combined PDF: {str(e)}', type='negative')
+            return
+        ui.notify(f'{pages} weeks exported to {output_path}', type='positive')
+        offer_download(output_path)
+        return
+
+    try:
+        result = await run_batch_with_progress(render_batch, progress_bar, status_label, records, fields, str(TEMPLATE_PATH), str(session.output_dir))
+    except Exception as e:
+        ui.notify(f'Error generating batch: {str(e)}', type='negative')
+        return
+    notify_batch_result(result)
+
+async def regenerate_affected(progress_bar, status_label):
+    """Rebuild the reports in the output directory that the current profile makes out of date"""
+    from batch import regenerate_stale
+
+    session = current_session()
+    fields = session.fields
+    try:
+        result = await run_batch_with_progress(regenerate_stale, progress_bar, status_label, fields, str(TEMPLATE_PATH), str(session.output_dir))
+    except Exception as e:
+        ui.notify(f'Error regenerating reports: {str(e)}', type='negative')
+        return
+    if not result.total:
+        ui.notify('No previously generated reports found in the output directory', type='info')
+        return
+    notify_batch_result(result, 'rebuilt')
+    session.config_saver.schedule(fields)
+
+def create_preview(delay: float = 0.3):
+    """
+    Page preview that follows the form, redrawn once typing pauses for delay seconds.
+
+    A timer compares the form's data with what is shown; it only lays out text
+    while the preview is open and the data has been unchanged for delay seconds.
+    """
+    fields = current_session().fields
+    state = {'shown': None, 'pending': None, 'changed_at': 0.0, 'page_height': None}
+
+    with ui.expansion('Live Preview').style('width: 100%') as expansion:
+        image = ui.interactive_image().style('width: 100%; border: 1px solid #ddd')
+
+    async def refresh():
+        if not expansion.value:
+            return
+        from preview import backdrop_data_url, overlay_svg, template_backdrop
+
+        if state['page_height'] is None:
+            # Reading the template takes a moment, keep it off the event loop
+            state['page_height'] = 0
+            _, page_height, _ = await run.io_bound(template_backdrop, TEMPLATE_PATH)
+            image.source = backdrop_data_url(TEMPLATE_PATH)
+            state['page_height'] = page_height
+        if not state['page_height']:
+            return
+
+        data = fields.as_data()
+        now = time.monotonic()
+        if data != state['pending']:
+            # Still typing: wait for a pause
+            state['pending'] = data
+            state['changed_at'] = now
+            return
+        if data == state['shown'] or now - state['changed_at'] < delay:
+            return
+        image.content = overlay_svg(data, fields.as_coords(), state['page_height'], **fields.render_options())
+        state['shown'] = data
+
+    ui.timer(0.1, refresh)
+
+def track_line_count(textarea, field_name: str):
+    """Show how many lines the text will take on the PDF, updated while typing"""
+    # Measured with the font, sizes and boxes of the template's layout
+    options = current_session().fields.render_options()
+    font, font_size, line_spacing = options['font'], options['font_size'], options['line_spacing']
+    max_width = options['field_max_widths'][field_name]
+    max_height = options['field_max_heights'][field_name]
+    counter = ui.label('').classes('text-caption text-grey')
+
+    def update(_=None):
+        text = textarea.value or ''
+        line_count = len(wrap_text(text, max_width, font, font_size))
+        counter.text = f'{line_count} line{"s" if line_count != 1 else ""} on PDF'
+        if not fits_box(text, max_width, max_height, font, font_size, line_spacing):
+            fitted_size, _ = fit_font_size(text, max_width, max_height, font, font_size, line_spacing)
+            counter.text += f' - too long for the box, will be shrunk to {fitted_size:g}pt'
+
+    textarea.on_value_change(update)
+    update()
+
+def create_batch_dialog():
+    """Dialog for generating a whole date range at once"""
+    fields = current_session().fields
+    export_options = {'files': 'One PDF per week', 'combined': 'One combined PDF', 'archive': 'ZIP archive'}
+    if sessions.multi_user:
+        # The reports are downloaded in server mode, one file per week would mean many downloads
+        del export_options['files']
+    with ui.dialog() as dialog, ui.card().style('width: 500px; border-radius: 22px; padding: 22px;'):
+        ui.markdown('### Batch Generate')
+        ui.label('Generates one report per week. The current activities and hours are used for every week, an imported timesheet sets them per week.')
+        ui.label('"Regenerate Affected" rebuilds the reports already in the output directory that are out of date, e.g. after changing your name or training year.').classes('text-caption')
+        with ui.row().style('width: 100%; gap: 1rem'):
+            first_date_input = ui.input('From', value=fields.start_date.content).style('flex: 1')
+            last_date_input = ui.input('To', value=fields.end_date.content).style('flex: 1')
+        first_week_input = ui.input('First Week Number', value=fields.week_no.content or '1').style('width: 100%')
+        ui.upload(label='Or import a timesheet (CSV) or calendar (ICS)', auto_upload=True, on_upload=lambda e: run_exclusive(lambda: import_timesheet_file(e, progress_bar, status_label, export_radio.value))) \
+            .props('accept=".csv,.ics,.txt" flat bordered').style('width: 100%')
+        export_radio = ui.radio(export_options, value=next(iter(export_options))).props('inline')
+        progress_bar = ui.linear_progress(value=0, show_value=False).style('width: 100%')
+        status_label = ui.label('')
+
+        async def run_exclusive(action):
+            # Only one batch operation at a time
+            start_button.disable()
+            regenerate_button.disable()
+            try:
+                await action()
+            finally:
+                start_button.enable()
+                regenerate_button.enable()
+
+        async def start():
+            await run_exclusive(lambda: generate_batch(first_date_input.value, last_date_input.value, first_week_input.value, progress_bar, status_label, export_radio.value))
+
+        def download_archive():
+            # Rendered while the browser downloads it, see archive_download()
+            from batch import MAX_BATCH_WEEKS
+
+            if not batch_records(fields, first_date_input.value, last_date_input.value, first_week_input.value):
+                ui.notify(f'Please enter a valid date range of at most {MAX_BATCH_WEEKS} weeks', type='warning')
+                return
+            query = urlencode({'first': first_date_input.value, 'last': last_date_input.value, 'week': first_week_input.value})
+            ui.download(f'/export/archive.zip?{query}')
+
+        async def regenerate():
+            await run_exclusive(lambda: regenerate_affected(progress_bar, status_label))
+
+        with ui.row().style('width: 100%; justify-content: flex-end; gap: 0.5rem'):
+            ui.button('Close', on_click=dialog.close).props('flat')
+            ui.button('Download ZIP', on_click=download_archive).props('flat')
+            regenerate_button = ui.button('Regenerate Affected', on_click=regenerate).props('color=secondary')
+            start_button = ui.button('Generate', on_click=start).props('color=primary')
+
+    def open_dialog():
+        # Start from the week currently shown in the form
+        first_date_input.value = fields.start_date.content
+        last_date_input.value = fields.end_date.content
+        first_week_input.value = fields.week_no.content or '1'
+        progress_bar.value = 0
+        status_label.text = ''
+        dialog.open()
+
+    return open_dialog
+
 def create_ui():
     """Create the NiceGUI interface"""
+    session = current_session()
+    fields = session.fields
+    history = session.history
     ui.markdown('## Berichtsheft Generator').style('display: flex; width: 100%; justify-content: center;')
 
     with ui.column().style('width: 100%; max-width: 800px; margin: 0 auto; border-radius: 22px;'):
         ui.markdown('### Basic Information')
-        # Output directory field with browse button
-        with ui.row().style('width: 100%; gap: 0.5rem'):
-            output_dir_input = ui.input('Output Directory', value=fields.output_directory.content, placeholder='Where to save generated PDFs').style('flex: 1')
-            output_dir_input.bind_value(fields.output_directory, 'content')
-            
-            def browse_folder():
-                # For now, show a notification with instructions since file dialogs are complex in web UI
-                ui.notify('Copy and paste the folder path where you want to save PDFs', type='info')
-            
-            ui.button('📁', on_click=browse_folder).props('size=sm').style('align-self: end; margin-bottom: 6px')
+        # Output directory field with browse button; in server mode every user has a fixed
+        # directory on the server, so there is no input a browser could point elsewhere
+        if not sessions.multi_user:
+            with ui.row().style('width: 100%; gap: 0.5rem'):
+                output_dir_input = ui.input('Output Directory', value=fields.output_directory.content, placeholder='Where to save generated PDFs').style('flex: 1')
+                output_dir_input.bind_value(fields.output_directory, 'content')
+
+                def browse_folder():
+                    # For now, show a notification with instructions since file dialogs are complex in web UI
+                    ui.notify('Copy and paste the folder path where you want to save PDFs', type='info')
+
+                ui.button('📁', on_click=browse_folder).props('size=sm').style('align-self: end; margin-bottom: 6px')
         
         # Name field
         name_input = ui.input('Name', value=fields.name.content).style('width: 100%')
@@ -224,58 +535,98 @@ def create_ui():
                             end_date_input.value = computed_end
                 
                 start_date_input.on('blur', on_start_date_change)
+
+            week_info_label = ui.label('').classes('text-caption').style('width: 100%; text-align: center;')
+
+            def update_week_info():
+                """Point out public holidays in the week shown"""
+                calendar = calendar_for_week(fields.week_no.content, fields.start_date.content)
+                day = parse_date(fields.start_date.content)
+                week = calendar.week_of(day) if calendar and day else None
+                if week is None or not week.holidays:
+                    week_info_label.text = ''
+                else:
+                    week_info_label.text = f"Public holiday: {', '.join(week.holidays)} ({week.workdays} workdays, {week.hours:g} h)"
+
+            start_date_input.on('blur', update_week_info)
+            update_week_info()
             
             # Week navigation buttons
             with ui.row().style('width: 100%; gap: 0.5rem; justify-content: center; margin-top: 0.5rem'):
-                def go_to_previous_week():
+                def show_saved_week():
+                    """Fill the form with what was saved for the week now shown, or clear it for a new week"""
+                    record = history.load_week(fields.start_date.content)
+                    if record is None:
+                        # Nothing typed for this week yet; the weekly work hours stay as configured
+                        texts_1_input.value = ''
+                        texts_2_input.value = ''
+                        hour_2_input.value = ''
+                        texts_3_input.value = ''
+                        hour_3_input.value = ''
+                    else:
+                        if record.week_no:
+                            week_input.value = record.week_no
+                        texts_1_input.value = record.texts_1
+                        hour_1_input.value = record.hour_1
+                        texts_2_input.value = record.texts_2
+                        hour_2_input.value = record.hour_2
+                        texts_3_input.value = record.texts_3
+                        hour_3_input.value = record.hour_3
+                    # Paging on without typing anything does not save this week
+                    session.mark_week_shown()
+
+                def go_to_week(offset: int):
+                    # Neighbouring row of the training calendar the shown week belongs to
                     base_date = fields.start_date.content or fields.end_date.content
-                    monday, friday = get_week_dates(base_date, -1)
-                    if monday and friday:
-                        fields.start_date.content = monday
-                        fields.end_date.content = friday
-                        start_date_input.value = monday
-                        end_date_input.value = friday
-                        
-                        # Decrement week number
-                        current_week = fields.week_no.content.strip()
-                        if current_week.isdigit():
-                            new_week = max(1, int(current_week) - 1)  # Don't go below 1
-                            fields.week_no.content = str(new_week)
-                            week_input.value = str(new_week)
-                        
-                        # Auto-save after week change
-                        save_configuration(fields)
-                
+                    calendar = calendar_for_week(fields.week_no.content, base_date)
+                    if calendar is None:
+                        return
+                    shown = calendar.week_of(parse_date(base_date))
+                    week = calendar.week(shown.week_no + offset)
+                    if week is None:
+                        ui.notify(f'Week {shown.week_no + offset} is outside the training calendar', type='warning')
+                        return
+                    # Remember what was typed for the week we are leaving
+                    session.remember_week()
+
+                    fmt = date_format_of(base_date)
+                    monday, friday = format_date(week.monday, fmt), format_date(week.friday, fmt)
+                    fields.start_date.content = monday
+                    fields.end_date.content = friday
+                    start_date_input.value = monday
+                    end_date_input.value = friday
+                    fields.week_no.content = str(week.week_no)
+                    week_input.value = str(week.week_no)
+
+                    show_saved_week()
+                    update_week_info()
+
+                    # Auto-save after week change (coalesced while paging through weeks)
+                    session.config_saver.schedule(fields)
+
+                def go_to_previous_week():
+                    go_to_week(-1)
+
                 def go_to_next_week():
-                    base_date = fields.start_date.content or fields.end_date.content
-                    monday, friday = get_week_dates(base_date, 1)
-                    if monday and friday:
-                        fields.start_date.content = monday
-                        fields.end_date.content = friday
-                        start_date_input.value = monday
-                        end_date_input.value = friday
-                        
-                        # Increment week number
-                        current_week = fields.week_no.content.strip()
-                        if current_week.isdigit():
-                            new_week = int(current_week) + 1
-                            fields.week_no.content = str(new_week)
-                            week_input.value = str(new_week)
-                        elif not current_week:  # If empty, start at 1
-                            fields.week_no.content = "1"
-                            week_input.value = "1"
-                        
-                        # Auto-save after week change
-                        save_configuration(fields)
-                
+                    go_to_week(1)
+
                 def go_to_current_week():
-                    monday, friday = get_week_dates("", 0)  # Current week
+                    # The week number of today follows from the week currently shown
+                    calendar = calendar_for_week(fields.week_no.content, fields.start_date.content) if fields.week_no.content.strip() else None
+                    # Current week, written like the date shown
+                    monday, friday = get_week_dates("", 0, date_format_of(fields.start_date.content or fields.end_date.content))
                     if monday and friday:
+                        session.remember_week()
                         fields.start_date.content = monday
                         fields.end_date.content = friday
                         start_date_input.value = monday
                         end_date_input.value = friday
-                        # Note: Current week button doesn't change week number
+                        current = calendar.week_of(parse_date(monday)) if calendar else None
+                        if current is not None:
+                            fields.week_no.content = str(current.week_no)
+                            week_input.value = str(current.week_no)
+                        show_saved_week()
+                        update_week_info()
 
                 ui.button('← Previous Week', on_click=go_to_previous_week).props('size=sm color=secondary').style('border-radius: 100px;')
                 ui.button('This Week', on_click=go_to_current_week).props('size=sm color=primary').style('border-radius: 100px;')
@@ -291,6 +642,7 @@ def create_ui():
                     
                     hour_1_input = ui.input('Hours 1', value=fields.hour_1.content).style('width: 100px')
                     hour_1_input.bind_value(fields.hour_1, 'content')
+                track_line_count(texts_1_input, 'texts_1')
         
 
         # Learning textarea
@@ -303,6 +655,7 @@ def create_ui():
                     
                     hour_2_input = ui.input('Hours 2', value=fields.hour_2.content).style('width: 100px')
                     hour_2_input.bind_value(fields.hour_2, 'content')
+                track_line_count(texts_2_input, 'texts_2')
 
         # School textarea
         with ui.column().style("gap: 0; width: 100%;"):
@@ -314,6 +667,18 @@ def create_ui():
                     
                     hour_3_input = ui.input('Hours 3', value=fields.hour_3.content).style('width: 100px')
                     hour_3_input.bind_value(fields.hour_3, 'content')
+                track_line_count(texts_3_input, 'texts_3')
+
+        # Search over everything typed in earlier weeks
+        with ui.column().style("gap: 0; width: 100%;"):
+            ui.markdown('#### Past Activities').style('margin-left: 16px;')
+            with ui.card().style('width: 100%; gap: 0.5rem; padding: 22px; border-radius: 22px;'):
+                create_activity_search({'+ Work': texts_1_input, '+ Learning': texts_2_input, '+ School': texts_3_input})
+
+        # What the page will look like, while typing
+        with ui.column().style("gap: 0; width: 100%;"):
+            with ui.card().style('width: 100%; gap: 0.5rem; padding: 22px; border-radius: 22px;'):
+                create_preview()
         
 
 
@@ -330,25 +695,117 @@ def create_ui():
     # Generate PDF button and Save Configuration
     with ui.row().style('width: 100%; max-width: 800px; margin: 1rem auto; text-align: center; border-radius: 22px; justify-content: center; gap: 1rem;'):
         def save_config():
-            success = save_configuration(fields)
+            success = session.save()
             if success:
                 ui.notify('Configuration saved successfully! ✅', type='positive')
             else:
                 ui.notify('Failed to save configuration ❌', type='negative')
         
         # ui.button('💾 Save Settings', on_click=save_config).props('color=secondary size=md').style('border-radius: 100px;')
-        ui.button('Generate PDF', on_click=generate_pdf).props('color=primary size=lg').style('border-radius: 100px;')
+        async def on_generate():
+            # One generation at a time; the spinner shows it is still running
+            generate_button.disable()
+            generate_button.props('loading')
+            try:
+                await generate_pdf(refresh_diagnostics)
+            finally:
+                generate_button.props(remove='loading')
+                generate_button.enable()
+
+        generate_button = ui.button('Generate PDF', on_click=on_generate).props('color=primary size=lg').style('border-radius: 100px;')
+        open_batch_dialog = create_batch_dialog()
+        ui.button('Batch Generate', on_click=open_batch_dialog).props('color=secondary size=lg').style('border-radius: 100px;')
+
+    with ui.expansion('Diagnostics').style('width: 100%; max-width: 800px; margin: 0 auto 1rem auto;'):
+        refresh_diagnostics = create_diagnostics_view(session.diagnostics)
+
+@app.get('/export/archive.zip')
+def archive_download(request: Request, first: str, last: str, week: str = '1'):
+    """ZIP archive of the weeks from first to last, streamed to the client while it is rendered"""
+    from batch import archive_jobs, get_archive_filename, stream_archive
+
+    if sessions.multi_user:
+        # Only users who opened the page, so requests without a session don't create new users
+        if not sessions.exists(request.session.get('id', '')):
+            raise HTTPException(status_code=403, detail='unknown session')
+        fields = sessions.get(request.session['id']).fields
+    else:
+        fields = sessions.get(LOCAL_USER).fields
+    records = batch_records(fields, first, last, week)
+    if not records:
+        raise HTTPException(status_code=400, detail='invalid date range')
+    return StreamingResponse(
+        stream_archive(archive_jobs(records, fields), str(TEMPLATE_PATH)),
+        media_type='application/zip',
+        headers={'Content-Disposition': f'attachment; filename="{get_archive_filename(records)}"'},
+    )
+
+def index_page():
+    """Page of the user the browser belongs to (server mode); tabs of the same browser share their state"""
+    client_sessions[ui.context.client] = sessions.get(app.storage.browser['id'])
+    create_ui()
+
+def get_storage_secret(data_dir: Path) -> str:
+    """Key that signs the session cookies, kept in data_dir so users stay logged in across restarts"""
+    secret = os.environ.get('BERICHTSHEFT_STORAGE_SECRET')
+    if secret:
+        return secret
+    secret_path = data_dir / 'storage_secret'
+    if secret_path.exists():
+        return secret_path.read_text(encoding='utf-8').strip()
+    from file_manager import atomic_open
+    secret = secrets.token_urlsafe(32)
+    with atomic_open(secret_path, 'w', encoding='utf-8') as f:
+        f.write(secret)
+    os.chmod(secret_path, 0o600)
+    return secret
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Berichtsheft Generator")
+    parser.add_argument("--server", action="store_true", help="Serve the app in the browser to many users instead of opening a window")
+    parser.add_argument("--host", default="0.0.0.0", help="Address to listen on in server mode (default: all interfaces)")
+    parser.add_argument("--port", type=int, default=8080, help="Port to listen on in server mode (default: 8080)")
+    parser.add_argument("--workers", type=int, help="Render processes shared by all users in server mode (default: number of CPUs)")
+    parser.add_argument("--data-dir", type=Path, default=Path.home() / ".berichtsheft_generator" / "server", help="Directory for the users' settings, history and reports in server mode")
+    return parser.parse_args(argv)
 
 def main():
     """Main function to set up and run the application"""
-    # Set default values
-    set_default_values()
-    
-    # Create the UI
+    global sessions
+    args = parse_args()
+
+    if args.server:
+        from batch import start_shared_pool, shutdown_shared_pool
+
+        args.data_dir.mkdir(parents=True, exist_ok=True)
+        sessions = SessionStore(args.data_dir)
+        ui.page('/')(index_page)
+
+        # One pool of render processes for everybody, started with the server
+        app.on_startup(lambda: print(f"Rendering with {start_shared_pool(str(TEMPLATE_PATH), args.workers)} worker processes"))
+        app.on_startup(start_warm_up)
+        # Save every user's pending settings and current week
+        app.on_shutdown(sessions.close_all)
+        app.on_shutdown(shutdown_shared_pool)
+
+        ui.run(title='Berichtsheft Generator', host=args.host, port=args.port, show=False, reload=False, storage_secret=get_storage_secret(args.data_dir))
+        return
+
+    # Set default values and create the UI
+    session = sessions.get(LOCAL_USER)
     create_ui()
+
+    # Load the PDF stack while the window is coming up
+    app.on_startup(start_warm_up)
+    # Don't lose a pending auto-save or the current week's texts when the window is closed
+    app.on_shutdown(session.close)
+    # The window's web view ignores ui.download() (Download ZIP) unless allowed
+    app.native.settings['ALLOW_DOWNLOADS'] = True
     
     # Run the application
     ui.run(title='Berichtsheft Generator', port=native.find_open_port(), show=False, native=True, reload=False)
 
-if __name__ in {"__main__", "__mp_main__"}:
+# Not "__mp_main__": the render pool's worker processes import this module under
+# that name on spawn platforms and must not start the app. ui.run never reloads.
+if __name__ == "__main__":
     main()
@@ -0,0 +1,259 @@
+"""
+Weekly notes kept as Markdown or text files, turned into week records.
+
+One file holds one week. The week is taken from the file (a "Woche: 12" or
+"Datum: 17.11.2025" line, or a date in the title) or from its name
+(2025-11-17.md, KW47-2025.md, woche_12.txt). Headings split the notes into the
+report's three sections, hours can follow the heading:
+
+    # Woche 12 (17.11.2025)
+    ## Betriebliche Tätigkeiten (24 h)
+    - Angular Services umgebaut
+    ## Unterweisungen
+    Stunden: 4
+    - Datenschutzschulung
+    ## Berufsschule (12h)
+    - LF8: Daten systemübergreifend bereitstellen
+
+Text without any section heading goes to the first section.
+
+A NotesIndex remembers size, mtime and hash of every file it has handed out,
+so scanning a folder only reads files that were added or changed since.
+"""
+import hashlib
+import json
+import os
+import re
+from dataclasses import asdict, dataclass
+from datetime import date, timedelta
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from schemas import WeekRecord
+from file_manager import atomic_open
+from training_calendar import DATE_FORMATS, TrainingCalendar, format_date, parse_date
+
+NOTE_SUFFIXES = (".md", ".markdown", ".txt")
+INDEX_NAME = ".berichtsheft_notes_index.json"
+
+# (text field, hours field, heading keywords); checked in this order, so
+# "Betriebliche Schulung" is an instruction and "Berufsschule" is school
+SECTIONS = (
+    ("texts_2", "hour_2", ("unterweisung", "schulung", "lehrgang", "training", "instruction")),
+    ("texts_3", "hour_3", ("schule", "school", "unterricht")),
+    ("texts_1", "hour_1", ("betrieb", "tätigkeit", "taetigkeit", "arbeit", "work")),
+)
+
+_HEADING_RE = re.compile(r"^\s*#{1,6}\s*(.*?)\s*#*\s*$")
+_LABEL_RE = re.compile(r"^\s*([^:\-*•\d][^:]{0,60}):\s*(.*)$")
+_HOURS_RE = re.compile(r"(\d+(?:[.,]\d+)?)\s*(?:h|std\.?|stunden|hours?)\b", re.IGNORECASE)
+_BULLET_RE = re.compile(r"^\s*[-*+•]\s+")
+_DATE_RE = re.compile(r"\b(\d{1,2})([./-])(\d{1,2})\2(\d{4})\b")
+_ISO_DATE_RE = re.compile(r"\b(\d{4})-(\d{2})-(\d{2})\b")
+_ISO_WEEK_RE = re.compile(r"\b(\d{4})-?W(\d{1,2})\b|\bKW\s*[-_]?(\d{1,2})[-_ .]+(\d{4})\b", re.IGNORECASE)
+_WEEK_NO_RE = re.compile(r"(?:^|[^a-z])(?:w|woche|week)[-_ ]?(\d{1,3})(?![\d.])", re.IGNORECASE)
+
+_WEEK_KEYS = ("woche", "week", "nummer", "nr")
+_DATE_KEYS = ("datum", "date", "vom", "start", "montag")
+_HOURS_KEYS = ("stunden", "hours", "std")
+
+
+def find_date(text: str) -> Optional[date]:
+    """First date in text: DD.MM.YYYY (also / and -), YYYY-MM-DD or an ISO week (2025-W47, KW47-2025)"""
+    match = _DATE_RE.search(text)
+    if match:
+        parsed = parse_date(match.group(0))
+        if parsed:
+            return parsed
+    match = _ISO_DATE_RE.search(text)
+    if match:
+        try:
+            return date(int(match.group(1)), int(match.group(2)), int(match.group(3)))
+        except ValueError:
+            pass
+    match = _ISO_WEEK_RE.search(text)
+    if match:
+        year, week = (match.group(1), match.group(2)) if match.group(1) else (match.group(4), match.group(3))
+        try:
+            return date.fromisocalendar(int(year), int(week), 1)
+        except ValueError:
+            pass
+    return None
+
+
+def section_for(title: str) -> Optional[Tuple[str, str]]:
+    """(text field, hours field) of the report section a heading or category names, if any"""
+    lowered = title.lower()
+    for text_field, hours_field, keywords in SECTIONS:
+        if any(keyword in lowered for keyword in keywords):
+            return text_field, hours_field
+    return None
+
+
+def _hours_in(text: str) -> str:
+    match = _HOURS_RE.search(text)
+    return match.group(1) if match else ""
+
+
+def parse_notes(text: str, filename: str = "", calendar: Optional[TrainingCalendar] = None, date_format: str = DATE_FORMATS[0]) -> Optional[WeekRecord]:
+    """
+    Week record of one notes file, or None if the file can't be placed in a week.
+
+    calendar fills in the date from a week number or the week number from a date.
+    The record's dates are written in date_format.
+    """
+    values: Dict[str, List[str]] = {"texts_1": [], "texts_2": [], "texts_3": []}
+    hours: Dict[str, str] = {}
+    week_no = ""
+    monday = None
+    section = None  # (text field, hours field) of the current section
+
+    for line in text.splitlines():
+        if line.strip() in ("---", "+++"):
+            # Front matter delimiters
+            continue
+
+        heading = _HEADING_RE.match(line)
+        label = None if heading else _LABEL_RE.match(line)
+        if heading or (label and not label.group(2).strip() and section_for(label.group(1))):
+            title = heading.group(1) if heading else label.group(1)
+            found = section_for(title)
+            if found:
+                section = found
+                if _hours_in(title):
+                    hours[section[1]] = _hours_in(title)
+            elif monday is None:
+                # A title like "Woche 12 (17.11.2025)"
+                monday = find_date(title)
+                week_match = _WEEK_NO_RE.search(title)
+                if week_match and not week_no:
+                    week_no = week_match.group(1)
+            continue
+
+        if label:
+            key = label.group(1).strip().lower()
+            value = label.group(2).strip()
+            if key in _HOURS_KEYS and section is not None:
+                hours[section[1]] = _hours_in(value + " h")
+                continue
+            if section is None and key in _WEEK_KEYS and value.isdigit():
+                week_no = value
+                continue
+            if section is None and key in _DATE_KEYS and find_date(value):
+                monday = find_date(value)
+                continue
+
+        target = section[0] if section else "texts_1"
+        content = _BULLET_RE.sub("", line).rstrip()
+        if content or values[target]:
+            values[target].append(content)
+
+    stem = Path(filename).stem
+    if monday is None:
+        monday = find_date(stem)
+    if not week_no:
+        week_match = _WEEK_NO_RE.search(stem)
+        if week_match:
+            week_no = week_match.group(1)
+
+    if calendar is not None:
+        if monday is None and week_no:
+            week = calendar.week(int(week_no))
+            monday = week.monday if week else None
+        elif monday is not None and not week_no:
+            week = calendar.week_of(monday)
+            week_no = str(week.week_no) if week else ""
+    if monday is None:
+        return None
+
+    monday -= timedelta(days=monday.weekday())
+    return WeekRecord(
+        week_no=week_no,
+        start_date=format_date(monday, date_format),
+        end_date=format_date(monday + timedelta(days=4), date_format),
+        hour_1=hours.get("hour_1", ""),
+        hour_2=hours.get("hour_2", ""),
+        hour_3=hours.get("hour_3", ""),
+        **{name: "\n".join(lines).strip() for name, lines in values.items()},
+    )
+
+
+@dataclass
+class NoteChange:
+    """A notes file that is new or changed since it was last handed out"""
+    name: str
+    mtime_ns: int
+    size: int
+    digest: str
+    record: Optional[WeekRecord]  # None if the file couldn't be placed in a week
+
+
+class NotesIndex:
+    """
+    Size, mtime and content hash of every notes file already processed, stored as JSON.
+
+    scan() lists the files that changed; mark_done() records one once it was
+    processed, so a file that failed is picked up again by the next scan.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.entries: Dict[str, dict] = {}
+        self._dirty = False
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                self.entries = json.load(f).get("files", {})
+        except (OSError, ValueError, AttributeError):
+            self.entries = {}
+
+    def scan(self, folder, calendar: Optional[TrainingCalendar] = None, date_format: str = DATE_FORMATS[0]) -> List[NoteChange]:
+        """
+        New and changed notes files in folder, by name.
+
+        Files whose size and mtime match the index are not opened. A file that
+        was only touched (same hash) is not reported either. Entries of
+        deleted files are dropped.
+        """
+        changes = []
+        seen = set()
+        with os.scandir(folder) as entries:
+            for entry in entries:
+                if not entry.name.lower().endswith(NOTE_SUFFIXES) or entry.name.startswith(".") or not entry.is_file():
+                    continue
+                seen.add(entry.name)
+                stat = entry.stat()
+                known = self.entries.get(entry.name)
+                if known is not None and known["mtime_ns"] == stat.st_mtime_ns and known["size"] == stat.st_size:
+                    continue
+
+                with open(entry.path, "rb") as f:
+                    data = f.read()
+                digest = hashlib.sha256(data).hexdigest()
+                if known is not None and known["hash"] == digest:
+                    self.entries[entry.name] = {**known, "mtime_ns": stat.st_mtime_ns, "size": stat.st_size}
+                    self._dirty = True
+                    continue
+
+                text = data.decode("utf-8-sig", errors="replace")
+                changes.append(NoteChange(entry.name, stat.st_mtime_ns, stat.st_size, digest, parse_notes(text, entry.name, calendar, date_format)))
+
+        for name in set(self.entries) - seen:
+            del self.entries[name]
+            self._dirty = True
+        changes.sort(key=lambda change: change.name)
+        return changes
+
+    def mark_done(self, change: NoteChange) -> None:
+        self.entries[change.name] = {
+            "mtime_ns": change.mtime_ns,
+            "size": change.size,
+            "hash": change.digest,
+            "week": asdict(change.record) if change.record else None,
+        }
+        self._dirty = True
+
+    def save(self) -> None:
+        if not self._dirty:
+            return
+        with atomic_open(self.path, "w", encoding="utf-8") as f:
+            json.dump({"version": 1, "files": self.entries}, f, indent=2, sort_keys=True)
+        self._dirty = False
@@ -0,0 +1,112 @@
+"""
+Content-addressed cache of generated reports.
+
+Every output directory gets a small manifest that maps each report file to a
+hash of everything that went into it: the template file, the layout (field
+coordinates), the field data, the render options and the renderer version.
+Since the renderer writes byte-identical PDFs for identical input, a report
+whose hash is unchanged does not need to be rendered again.
+
+The manifest also keeps the week and profile values each report was rendered
+from, so reports can be rebuilt after the profile changed (see
+batch.regenerate_stale).
+"""
+import hashlib
+import json
+from dataclasses import asdict
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, List, Optional
+from schemas import Fields, WeekRecord, PROFILE_FIELDS
+from file_manager import atomic_open
+from generator import RENDERER_VERSION
+
+MANIFEST_NAME = ".berichtsheft_manifest.json"
+
+
+@lru_cache(maxsize=16)
+def _file_hash(path: str, mtime_ns: int, size: int) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 16), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def template_hash(template_path: str) -> str:
+    """sha256 of the template file, only re-read when the file changes"""
+    stat = Path(template_path).stat()
+    return _file_hash(str(template_path), stat.st_mtime_ns, stat.st_size)
+
+
+def render_key(template_path: str, data: dict, coords: dict, **options) -> str:
+    """Stable hash of all inputs of one render; options are the renderer's keyword arguments"""
+    payload = {
+        "renderer": RENDERER_VERSION,
+        "template": template_hash(template_path),
+        "coords": coords,
+        "data": data,
+        "options": options,
+    }
+    canonical = json.dumps(payload, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def report_inputs(fields: Fields) -> dict:
+    """The user-entered values a report depends on, as stored in the manifest"""
+    return {
+        "profile": {name: getattr(fields, name).content for name in PROFILE_FIELDS},
+        "week": asdict(WeekRecord.from_fields(fields)),
+    }
+
+
+class OutputCache:
+    """The manifest of one output directory"""
+
+    def __init__(self, output_dir):
+        self.path = Path(output_dir) / MANIFEST_NAME
+        self.entries: Dict[str, dict] = {}
+        self._dirty = False
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                self.entries = json.load(f).get("files", {})
+        except (OSError, ValueError, AttributeError):
+            # Missing or unreadable manifest: everything gets rendered once
+            self.entries = {}
+
+    def is_current(self, filename: str, key: str) -> bool:
+        """True if filename exists and was rendered from exactly these inputs"""
+        entry = self.entries.get(filename)
+        if entry is None or entry.get("key") != key:
+            return False
+        try:
+            # A file replaced or truncated by hand no longer counts as cached
+            return (self.path.parent / filename).stat().st_size == entry.get("size")
+        except OSError:
+            return False
+
+    def record(self, filename: str, key: str, inputs: Optional[dict] = None, size: Optional[int] = None) -> None:
+        """Remember that filename was rendered from key; inputs come from report_inputs()"""
+        if size is None:
+            size = (self.path.parent / filename).stat().st_size
+        entry = {"key": key, "size": size}
+        if inputs is not None:
+            entry["inputs"] = inputs
+        self.entries[filename] = entry
+        self._dirty = True
+
+    def recorded_weeks(self) -> List[WeekRecord]:
+        """Weeks of all reports that still exist and were recorded with their inputs"""
+        return [
+            WeekRecord.from_dict(entry["inputs"]["week"])
+            for filename, entry in sorted(self.entries.items())
+            if "inputs" in entry and (self.path.parent / filename).exists()
+        ]
+
+    def save(self) -> None:
+        """Write the manifest if anything was recorded"""
+        if not self._dirty:
+            return
+        with atomic_open(self.path, "w", encoding="utf-8") as f:
+            json.dump({"version": 1, "files": self.entries}, f, indent=2, sort_keys=True)
+        self._dirty = False
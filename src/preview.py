@@ -0,0 +1,166 @@
+"""
+Live preview of a report page as SVG.
+
+The template page is reduced once to its filled rectangles (the table lines)
+and its text labels, which make up a static background image. The report's
+fields are drawn on top with the same line breaking and auto-fit as the
+generator (see text_layout), each field into its own memoized SVG fragment,
+so a keystroke only lays out the field that changed.
+
+Only text_layout and PyPDF2 are used; reportlab's canvas is not involved.
+"""
+import base64
+import os
+from functools import lru_cache
+from pathlib import Path
+from typing import List, Optional, Tuple
+from xml.sax.saxutils import escape
+from text_layout import wrap_text, fit_font_size
+
+# Fonts the browser uses for the standard PDF fonts
+SVG_FONTS = {
+    "Helvetica": "Helvetica, Arial, sans-serif",
+    "Times-Roman": "'Times New Roman', Times, serif",
+    "Courier": "'Courier New', Courier, monospace",
+}
+
+_FILL_OPERATORS = (b"f", b"F", b"f*", b"B", b"B*", b"b", b"b*")
+
+
+def _multiply(m, n) -> Tuple[float, ...]:
+    """Product of two PDF matrices [a b c d e f]"""
+    return (
+        m[0] * n[0] + m[1] * n[2], m[0] * n[1] + m[1] * n[3],
+        m[2] * n[0] + m[3] * n[2], m[2] * n[1] + m[3] * n[3],
+        m[4] * n[0] + m[5] * n[2] + n[4], m[4] * n[1] + m[5] * n[3] + n[5],
+    )
+
+
+def _svg_font(font: str) -> str:
+    return SVG_FONTS.get(font.split("-")[0], SVG_FONTS["Helvetica"])
+
+
+@lru_cache(maxsize=4)
+def _backdrop(path: str, mtime_ns: int) -> Tuple[float, float, str]:
+    from PyPDF2 import PdfReader
+    from PyPDF2.generic import ContentStream
+
+    reader = PdfReader(path)
+    page = reader.pages[0]
+    width, height = float(page.mediabox.width), float(page.mediabox.height)
+    elements: List[str] = []
+
+    # Filled rectangles, i.e. the table's lines and shaded cells
+    ctm = (1, 0, 0, 1, 0, 0)
+    stack = []
+    gray = 0.0
+    pending = []
+    for operands, operator in ContentStream(page.get_contents(), reader).operations:
+        if operator == b"q":
+            stack.append((ctm, gray))
+        elif operator == b"Q" and stack:
+            ctm, gray = stack.pop()
+        elif operator == b"cm":
+            ctm = _multiply([float(value) for value in operands], ctm)
+        elif operator == b"g":
+            gray = float(operands[0])
+        elif operator == b"re":
+            x, y, w, h = (float(value) for value in operands)
+            pending.append((x * ctm[0] + ctm[4], y * ctm[3] + ctm[5], w * ctm[0], h * ctm[3]))
+        elif operator in _FILL_OPERATORS:
+            shade = round(gray * 255)
+            for x, y, w, h in pending:
+                elements.append(
+                    f'<rect x="{x:.2f}" y="{height - y - max(h, 0):.2f}" width="{abs(w):.2f}" height="{abs(h):.2f}" '
+                    f'fill="rgb({shade},{shade},{shade})"/>'
+                )
+            pending = []
+        elif operator in (b"n", b"S", b"s"):
+            # Clipping paths and strokes (the template draws its lines as filled rectangles)
+            pending = []
+
+    # Text labels, positioned by PyPDF2's text extraction
+    def visit_text(text, cm, tm, font_dict, font_size):
+        if not text.strip():
+            return
+        matrix = _multiply(tm, cm)
+        size = font_size * (matrix[3] or 1)
+        elements.append(
+            f'<text x="{matrix[4]:.2f}" y="{height - matrix[5]:.2f}" font-size="{size:.2f}" '
+            f'font-family="{_svg_font("Helvetica")}" xml:space="preserve">{escape(text)}</text>'
+        )
+
+    page.extract_text(visitor_text=visit_text)
+
+    svg = (
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{width:g}" height="{height:g}" viewBox="0 0 {width:g} {height:g}">'
+        f'<rect width="100%" height="100%" fill="white"/>{"".join(elements)}</svg>'
+    )
+    return width, height, svg
+
+
+def template_backdrop(template_path) -> Tuple[float, float, str]:
+    """(width, height, svg) of the template's first page, re-read when the file changes"""
+    path = str(Path(template_path).resolve())
+    return _backdrop(path, os.stat(path).st_mtime_ns)
+
+
+def backdrop_data_url(template_path) -> str:
+    """The template background as a data: URL for an <img>"""
+    _, _, svg = template_backdrop(template_path)
+    return "data:image/svg+xml;base64," + base64.b64encode(svg.encode("utf-8")).decode("ascii")
+
+
+@lru_cache(maxsize=256)
+def field_fragment(
+    value: str,
+    x: float,
+    y: float,
+    page_height: float,
+    font: str = "Helvetica",
+    font_size: float = 12,
+    line_spacing: float = 14,
+    max_width: Optional[float] = None,
+    max_height: Optional[float] = None,
+    auto_fit: bool = False,
+) -> str:
+    """
+    SVG of one field's text block, laid out like create_overlay does.
+
+    Wrapped fields also get their box outlined, so it is visible how much room is left.
+    """
+    if not value:
+        return ""
+    parts = []
+    if max_width is not None:
+        if auto_fit and max_height is not None:
+            font_size, line_spacing = fit_font_size(value, max_width, max_height, font, font_size, line_spacing)
+        lines = wrap_text(value, max_width, font, font_size)
+        if max_height is not None:
+            parts.append(
+                f'<rect x="{x:.2f}" y="{page_height - y - font_size:.2f}" width="{max_width:.2f}" '
+                f'height="{max_height + font_size:.2f}" fill="none" stroke="#1976d2" stroke-dasharray="3 3" stroke-width="0.5"/>'
+            )
+    else:
+        lines = value.split("\n")
+
+    tspans = "".join(
+        f'<tspan x="{x:.2f}" y="{page_height - y + index * line_spacing:.2f}">{escape(line)}</tspan>'
+        for index, line in enumerate(lines)
+    )
+    parts.append(f'<text font-size="{font_size:g}" font-family="{_svg_font(font)}" fill="#0d47a1" xml:space="preserve">{tspans}</text>')
+    return "".join(parts)
+
+
+def overlay_svg(data: dict, coords: dict, page_height: float, font: str = "Helvetica", font_size: int = 12, line_spacing: int = 14, field_max_widths=None, field_max_heights=None, auto_fit: bool = False) -> str:
+    """SVG elements for all fields, to be drawn over the template background"""
+    field_max_widths = field_max_widths or {}
+    field_max_heights = field_max_heights or {}
+    return "".join(
+        field_fragment(
+            str(data[name]), x, y, page_height, font, font_size, line_spacing,
+            field_max_widths.get(name), field_max_heights.get(name), auto_fit,
+        )
+        for name, (x, y) in coords.items()
+        if data.get(name)
+    )
@@ -4,11 +4,16 @@ from reportlab.lib.pagesizes import A4
 from pathlib import Path
 import textwrap
 from datetime import datetime
+from template_registry import Layout, default_layout
+from training_calendar import sign_date_for
 
 
 # PDF dimensions
 PDF_WIDTH, PDF_HEIGHT = A4  # A4 is (595.27, 841.89)
 
+# Fields that describe the apprentice and stay the same for every week
+PROFILE_FIELDS = ('name', 'beruf', 'abteilung', 'ausbildung_jahr')
+
 def adjust_y(y: float) -> float:
     """Flip coordinate system to PDF coordinates."""
     return PDF_HEIGHT - y
@@ -26,69 +31,71 @@ class Field:
         # Automatically dedent triple-quoted or indented text
         self._content = textwrap.dedent(value).strip("\n")
 
+def layout_field(content: str = "") -> Field:
+    """Field of the template; Fields places it at the coordinates of its own layout"""
+    return Field((0, 0), content)
+
 # Define schema of all fields
 @dataclass
 class Fields:
-    week_no: Field = field(default_factory=lambda: Field((505, adjust_y(44))))
-    name: Field = field(default_factory=lambda: Field((211, adjust_y(70))))
+    week_no: Field = field(default_factory=layout_field)
+    name: Field = field(default_factory=layout_field)
 
-    beruf: Field = field(default_factory=lambda: Field((170, adjust_y(96)), "Fachinformatiker - Anwendungsentwicklung"))
-    ausbildung_jahr: Field = field(default_factory=lambda: Field((528, adjust_y(96))))
-    abteilung: Field = field(default_factory=lambda: Field((470, adjust_y(121)), "IT-Abteilung"))
+    beruf: Field = field(default_factory=lambda: layout_field("Fachinformatiker - Anwendungsentwicklung"))
+    ausbildung_jahr: Field = field(default_factory=layout_field)
+    abteilung: Field = field(default_factory=lambda: layout_field("IT-Abteilung"))
 
-    start_date: Field = field(default_factory=lambda: Field((171, adjust_y(121))))
-    end_date: Field = field(default_factory=lambda: Field((257, adjust_y(121))))
+    start_date: Field = field(default_factory=layout_field)
+    end_date: Field = field(default_factory=layout_field)
 
-    texts_1: Field = field(default_factory=lambda: Field((50, adjust_y(176))))
-    hour_1: Field = field(default_factory=lambda: Field((502, adjust_y(176))))
+    texts_1: Field = field(default_factory=layout_field)
+    hour_1: Field = field(default_factory=layout_field)
 
-    texts_2: Field = field(default_factory=lambda: Field((50, adjust_y(352))))
-    hour_2: Field = field(default_factory=lambda: Field((502, adjust_y(352))))
+    texts_2: Field = field(default_factory=layout_field)
+    hour_2: Field = field(default_factory=layout_field)
 
-    texts_3: Field = field(default_factory=lambda: Field((50, adjust_y(525))))
-    hour_3: Field = field(default_factory=lambda: Field((502, adjust_y(525))))
+    texts_3: Field = field(default_factory=layout_field)
+    hour_3: Field = field(default_factory=layout_field)
 
-    date_of_sign: Field = field(default_factory=lambda: Field((50, adjust_y(716))))
-    date_of_sign_2: Field = field(default_factory=lambda: Field((305, adjust_y(716))))
+    date_of_sign: Field = field(default_factory=layout_field)
+    date_of_sign_2: Field = field(default_factory=layout_field)
     
     # UI configuration fields (not rendered to PDF)
     output_directory: Field = field(default_factory=lambda: Field((0, 0)))
 
+    # Template the fields are rendered onto; its compiled tables are shared, not copied
+    layout: Layout = field(default_factory=default_layout, repr=False, compare=False)
+
+    def __post_init__(self) -> None:
+        # Position every field by the layout it belongs to (see template_registry)
+        coords = self.layout.coords
+        for name, value in self.as_dict().items():
+            if name in coords:
+                value.coords = coords[name]
+
     def as_dict(self) -> Dict[str, Field]:
         """Return dict-like view, useful for iterating in PDF generator."""
-        return self.__dict__
+        return {name: value for name, value in self.__dict__.items() if isinstance(value, Field)}
 
     def as_coords(self) -> Dict[str, Tuple[float, float]]:
-        """Return coordinates for PDF fields only (excludes UI configuration fields)"""
-        ui_fields = {'output_directory'}  # Fields that are UI-only
-        return {name: f.coords for name, f in self.__dict__.items() if name not in ui_fields}
+        """Return coordinates for PDF fields only (the layout's read-only table)"""
+        return self.layout.coords
 
     def as_data(self) -> Dict[str, str]:
-        """Return data for PDF fields only (excludes UI configuration fields)"""
-        ui_fields = {'output_directory'}  # Fields that are UI-only
-        return {name: f.content for name, f in self.__dict__.items() if name not in ui_fields}
+        """Return data for the fields of the layout; layout fields without a form field stay empty"""
+        return {name: self.__dict__[name].content if name in self.__dict__ else "" for name in self.layout.field_names}
 
     def get_text_wrapping_fields(self) -> Dict[str, int]:
         """Return fields that need text wrapping with their maximum widths in points"""
-        # Type-safe approach: reference the actual field attributes and get their names
-        wrapping_config = [
-            (self.texts_1, 475),
-            (self.texts_2, 475), 
-            (self.texts_3, 475),
-        ]
-        
-        # Get the field names by finding which attribute matches each Field object
-        result = {}
-        field_dict = self.as_dict()
-        
-        for field_obj, width in wrapping_config:
-            # Find the attribute name that corresponds to this Field object
-            for attr_name, attr_field in field_dict.items():
-                if attr_field is field_obj:
-                    result[attr_name] = width
-                    break
-        
-        return result
+        return self.layout.wrap_widths
+
+    def get_text_box_heights(self) -> Dict[str, float]:
+        """Return the usable height of each activity box in points, below the field's first baseline"""
+        return self.layout.box_heights
+
+    def render_options(self) -> Dict[str, object]:
+        """Keyword arguments for the generator's render functions (font, wrapping, box heights)"""
+        return self.layout.render_options
 
 
 @dataclass
@@ -153,3 +160,62 @@ class PersistedFields:
             last_saved=data.get("last_saved"),
             work_hours=data.get("work_hours", "")
         )
+
+
+@dataclass
+class WeekRecord:
+    """Per-week content used for batch generation"""
+    week_no: str = ""
+    start_date: str = ""
+    end_date: str = ""
+    texts_1: str = ""
+    hour_1: str = ""
+    texts_2: str = ""
+    hour_2: str = ""
+    texts_3: str = ""
+    hour_3: str = ""
+
+    @classmethod
+    def from_fields(cls, fields: Fields) -> 'WeekRecord':
+        """Create WeekRecord from current Fields state"""
+        return cls(
+            week_no=fields.week_no.content,
+            start_date=fields.start_date.content,
+            end_date=fields.end_date.content,
+            texts_1=fields.texts_1.content,
+            hour_1=fields.hour_1.content,
+            texts_2=fields.texts_2.content,
+            hour_2=fields.hour_2.content,
+            texts_3=fields.texts_3.content,
+            hour_3=fields.hour_3.content,
+        )
+
+    def apply_to_fields(self, fields: Fields) -> None:
+        """Apply week values (and the signature dates computed from them) to Fields instance"""
+        fields.week_no.content = self.week_no
+        fields.start_date.content = self.start_date
+        fields.end_date.content = self.end_date
+        fields.texts_1.content = self.texts_1
+        fields.hour_1.content = self.hour_1
+        fields.texts_2.content = self.texts_2
+        fields.hour_2.content = self.hour_2
+        fields.texts_3.content = self.texts_3
+        fields.hour_3.content = self.hour_3
+        sign_date = sign_date_for(self.end_date)
+        fields.date_of_sign.content = sign_date
+        fields.date_of_sign_2.content = sign_date
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'WeekRecord':
+        """Create WeekRecord from dictionary (for JSON/CSV loading)"""
+        return cls(
+            week_no=str(data.get("week_no", "")),
+            start_date=data.get("start_date", ""),
+            end_date=data.get("end_date", ""),
+            texts_1=data.get("texts_1", ""),
+            hour_1=str(data.get("hour_1", "")),
+            texts_2=data.get("texts_2", ""),
+            hour_2=str(data.get("hour_2", "")),
+            texts_3=data.get("texts_3", ""),
+            hour_3=str(data.get("hour_3", "")),
+        )
@@ -0,0 +1,177 @@
+"""
+Per-user state of the GUI: form fields, week history, activity index and settings.
+
+The desktop app has a single user whose files live in ~/.berichtsheft_generator
+as before. In server mode every user (one browser session) gets a directory of
+their own below the data directory:
+
+    <data dir>/users/<user id>/config.json
+    <data dir>/users/<user id>/history.sqlite3
+    <data dir>/users/<user id>/reports/
+
+Sessions are created on first use and kept for the lifetime of the process, so
+a reload or a second tab of the same browser shows the same state.
+"""
+import re
+import threading
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional
+from schemas import Fields, WeekRecord
+from file_manager import DebouncedConfigSaver, load_configuration, save_configuration
+from history import HistoryStore, week_key
+from activity_index import ActivityIndex
+
+# User of the desktop app
+LOCAL_USER = "local"
+
+_UNSAFE_RE = re.compile(r"[^A-Za-z0-9_-]")
+
+
+@dataclass
+class UserSession:
+    """Everything the GUI keeps for one user"""
+    user_id: str
+    fields: Fields
+    history: HistoryStore
+    activity_index: ActivityIndex
+    config_saver: DebouncedConfigSaver
+    config_path: Optional[Path] = None  # None: the desktop app's config file
+    reports_dir: Optional[Path] = None  # None: the output directory in the form is used (see output_dir)
+    # Results of the last generation, shown in the diagnostics panel
+    diagnostics: dict = field(default_factory=lambda: {'profile_next': False, 'timings': '', 'profile': ''})
+    # The week as it was last shown in or saved from the form; not saved again while unchanged
+    shown_week: Optional[WeekRecord] = None
+
+    def restore(self) -> None:
+        """Load the saved configuration (or defaults), the activity index and the saved week"""
+        # Only set defaults if no configuration was loaded
+        if not load_configuration(self.fields, self.config_path):
+            self.fields.ausbildung_jahr.content = "2"
+            self.fields.hour_1.content = "40"
+        if self.reports_dir is not None:
+            self.fields.output_directory.content = str(self.reports_dir)
+
+        # Make past activities searchable
+        self.activity_index.add_records(self.history.all_weeks())
+
+        # Restore what was typed for the saved week
+        record = self.history.load_week(self.fields.start_date.content)
+        if record is not None:
+            record.apply_to_fields(self.fields)
+        self.mark_week_shown()
+
+    @property
+    def output_dir(self) -> Path:
+        """Where reports are written: the fixed reports directory in server mode, else the one in the form"""
+        if self.reports_dir is not None:
+            return self.reports_dir
+        return Path(self.fields.output_directory.content)
+
+    def output_path(self, filename: str) -> Path:
+        """Path of a report in output_dir; in server mode, names leading out of reports_dir are rejected"""
+        path = self.output_dir / filename
+        if self.reports_dir is not None and not path.resolve().is_relative_to(self.reports_dir.resolve()):
+            raise ValueError(f"invalid report name: {filename}")
+        return path
+
+    def mark_week_shown(self) -> None:
+        """Note the week now in the form as unedited, e.g. after paging to it"""
+        self.shown_week = WeekRecord.from_fields(self.fields)
+
+    def remember_week(self, force: bool = False) -> None:
+        """
+        Save the current week to the history and update the activity search index.
+
+        Only weeks edited since they were shown are saved, unless force is set
+        (e.g. the week was generated).
+        """
+        fields = self.fields
+        record = WeekRecord.from_fields(fields)
+        if not force and record == self.shown_week:
+            return
+        if self.history.save_week(fields):
+            self.activity_index.set_week(
+                week_key(fields.start_date.content),
+                (fields.texts_1.content, fields.texts_2.content, fields.texts_3.content),
+            )
+            self.shown_week = record
+
+    def save(self) -> bool:
+        """Write the configuration now"""
+        return save_configuration(self.fields, config_path=self.config_path)
+
+    def close(self) -> None:
+        """Save what is pending and close the history database"""
+        self.config_saver.flush()
+        self.remember_week()
+        self.history.close()
+
+
+class SessionStore:
+    """
+    UserSessions by user id, created on first use.
+
+    Without a data directory there is only the desktop user, stored in the
+    home directory. With one, every user id gets its own directory below it.
+    """
+
+    def __init__(self, data_dir: Optional[Path] = None):
+        self.data_dir = Path(data_dir) if data_dir else None
+        self._sessions: Dict[str, UserSession] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def multi_user(self) -> bool:
+        return self.data_dir is not None
+
+    def user_dir(self, user_id: str) -> Path:
+        # Session ids come from a signed cookie, but are still not used as paths unchecked
+        return self.data_dir / "users" / (_UNSAFE_RE.sub("_", user_id) or "_")
+
+    def exists(self, user_id: str) -> bool:
+        """Whether the user has been here before (now or in an earlier run of the server)"""
+        with self._lock:
+            if user_id in self._sessions:
+                return True
+        return self.multi_user and self.user_dir(user_id).is_dir()
+
+    def get(self, user_id: str = LOCAL_USER) -> UserSession:
+        """Session of a user, loading it from disk the first time"""
+        with self._lock:
+            session = self._sessions.get(user_id)
+            if session is None:
+                session = self._sessions[user_id] = self._open(user_id)
+            return session
+
+    def _open(self, user_id: str) -> UserSession:
+        if not self.multi_user:
+            session = UserSession(user_id, Fields(), HistoryStore(), ActivityIndex(), DebouncedConfigSaver())
+        else:
+            directory = self.user_dir(user_id)
+            reports_dir = directory / "reports"
+            reports_dir.mkdir(parents=True, exist_ok=True)
+            config_path = directory / "config.json"
+            session = UserSession(
+                user_id,
+                Fields(),
+                HistoryStore(directory / "history.sqlite3"),
+                ActivityIndex(),
+                DebouncedConfigSaver(config_path=config_path),
+                config_path=config_path,
+                reports_dir=reports_dir,
+            )
+        session.restore()
+        return session
+
+    def all(self) -> List[UserSession]:
+        with self._lock:
+            return list(self._sessions.values())
+
+    def close_all(self) -> None:
+        """Save and close every session, e.g. on shutdown"""
+        for session in self.all():
+            try:
+                session.close()
+            except Exception as e:
+                print(f"Error closing session {session.user_id}: {e}")
@@ -0,0 +1,159 @@
+"""
+Report templates and their field layouts.
+
+Every template PDF comes with a JSON layout file of the same name, e.g.
+berichtsheft_wochenlich_template.json next to berichtsheft_wochenlich_template.pdf:
+
+    {
+      "title": "Berichtsheft (wöchentlich)",
+      "pdf": "berichtsheft_wochenlich_template.pdf",
+      "page_size": "A4",
+      "font": "Helvetica", "font_size": 12, "line_spacing": 14,
+      "fields": [
+        {"name": "week_no", "x": 505, "y": 44},
+        {"name": "texts_1", "x": 50, "y": 176, "wrap_width": 475, "box_height": 139},
+        ...
+      ]
+    }
+
+x and y are measured from the top left corner of the page. wrap_width turns on
+line wrapping; box_height is the usable height below the field's first baseline.
+
+Layouts are compiled once into an immutable Layout whose lookup tables the
+renderer uses as they are. Templates are found in the bundled assets/templates
+folder and in ~/.berichtsheft_generator/templates, where a user can drop
+their own template and layout.
+"""
+import json
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+from reportlab.lib import pagesizes
+
+LAYOUT_SUFFIX = ".json"
+DEFAULT_TEMPLATE_NAME = "berichtsheft_wochenlich_template"
+
+
+class FrozenDict(dict):
+    """Read-only dict; still a dict for the renderer, json and pickle"""
+
+    def _readonly(self, *args, **kwargs):
+        raise TypeError("layout tables are read-only")
+
+    __setitem__ = __delitem__ = clear = pop = popitem = setdefault = update = _readonly
+    __ior__ = _readonly
+
+    def __hash__(self):
+        return hash(tuple(self.items()))
+
+    def __reduce__(self):
+        return FrozenDict, (dict(self),)
+
+
+@dataclass(frozen=True, slots=True)
+class Layout:
+    """Compiled layout of one template"""
+    name: str
+    title: str
+    pdf_path: Path
+    field_names: Tuple[str, ...]
+    coords: FrozenDict  # field name -> (x, y) in PDF coordinates (origin bottom left)
+    wrap_widths: FrozenDict  # field name -> max line width in points
+    box_heights: FrozenDict  # field name -> usable height below the first baseline
+    render_options: FrozenDict  # keyword arguments for the generator's render functions
+
+
+def compile_layout(layout_path: Path) -> Layout:
+    """Read a layout file and build its lookup tables"""
+    layout_path = Path(layout_path)
+    with open(layout_path, "r", encoding="utf-8") as f:
+        spec = json.load(f)
+
+    _, page_height = getattr(pagesizes, spec.get("page_size", "A4"))
+    names = []
+    coords = {}
+    wrap_widths = {}
+    box_heights = {}
+    for entry in spec["fields"]:
+        name = entry["name"]
+        names.append(name)
+        # Flip to PDF coordinates
+        coords[name] = (entry["x"], page_height - entry["y"])
+        if "wrap_width" in entry:
+            wrap_widths[name] = entry["wrap_width"]
+        if "box_height" in entry:
+            box_heights[name] = float(entry["box_height"])
+
+    wrap_widths = FrozenDict(wrap_widths)
+    box_heights = FrozenDict(box_heights)
+    return Layout(
+        name=layout_path.stem,
+        title=spec.get("title", layout_path.stem),
+        pdf_path=layout_path.parent / spec.get("pdf", layout_path.stem + ".pdf"),
+        field_names=tuple(names),
+        coords=FrozenDict(coords),
+        wrap_widths=wrap_widths,
+        box_heights=box_heights,
+        render_options=FrozenDict(
+            font=spec.get("font", "Helvetica"),
+            font_size=spec.get("font_size", 12),
+            line_spacing=spec.get("line_spacing", 14),
+            field_max_widths=wrap_widths,
+            field_max_heights=box_heights,
+            auto_fit=True,
+        ),
+    )
+
+
+class TemplateRegistry:
+    """All templates with a layout file in the given directories; later directories override earlier ones"""
+
+    def __init__(self, directories: Iterable[Path]):
+        self._layout_paths: Dict[str, Path] = {}
+        for directory in directories:
+            directory = Path(directory)
+            if not directory.is_dir():
+                continue
+            for layout_path in sorted(directory.glob(f"*{LAYOUT_SUFFIX}")):
+                self._layout_paths[layout_path.stem] = layout_path
+        self._layouts: Dict[str, Layout] = {}
+
+    def names(self) -> List[str]:
+        return sorted(self._layout_paths)
+
+    def get(self, name: str) -> Layout:
+        """Compiled layout of a template; raises KeyError for unknown names"""
+        layout = self._layouts.get(name)
+        if layout is None:
+            layout = self._layouts[name] = compile_layout(self._layout_paths[name])
+        return layout
+
+    def find_by_pdf(self, pdf_path) -> Optional[Layout]:
+        """Layout of a template given by the path of its PDF, if it has one"""
+        layout_path = Path(pdf_path).with_suffix(LAYOUT_SUFFIX)
+        if layout_path.exists():
+            return compile_layout(layout_path)
+        return None
+
+    @property
+    def default(self) -> Layout:
+        if DEFAULT_TEMPLATE_NAME in self._layout_paths:
+            return self.get(DEFAULT_TEMPLATE_NAME)
+        return self.get(self.names()[0])
+
+
+def get_user_template_dir() -> Path:
+    return Path.home() / ".berichtsheft_generator" / "templates"
+
+
+@lru_cache(maxsize=1)
+def get_registry() -> TemplateRegistry:
+    """Registry of the bundled templates and the user's own"""
+    # Imported here, file_manager depends on schemas which depends on this module
+    from file_manager import get_template_path
+    return TemplateRegistry([get_template_path().parent, get_user_template_dir()])
+
+
+def default_layout() -> Layout:
+    return get_registry().default
@@ -0,0 +1,168 @@
+"""
+Line breaking based on real font metrics.
+
+Character widths come from reportlab's font metrics and are collected once per
+(font, size) into a lookup table. Wrapped paragraphs are memoized, so wrapping
+the same text again (e.g. on every keystroke) is a cache hit for every unchanged line.
+"""
+from functools import lru_cache
+from typing import Dict, List, Tuple
+
+
+def _pdfmetrics():
+    """Import reportlab's font metrics on first use; the GUI imports this module at startup"""
+    from reportlab.pdfbase import pdfmetrics
+    return pdfmetrics
+
+
+class WidthTable:
+    """Character widths in points for one font at one size"""
+
+    def __init__(self, font: str, font_size: float):
+        self.font = font
+        self.font_size = font_size
+        self._widths: Dict[str, float] = {}
+
+        # Single-byte fonts (the standard PDF fonts) ship a 256 entry width list
+        # in 1/1000 em for their encoding, which covers umlauts and ß
+        font_obj = _pdfmetrics().getFont(font)
+        widths = getattr(font_obj, "widths", None)
+        encoding = getattr(getattr(font_obj, "encoding", None), "name", None)
+        if widths and encoding == "WinAnsiEncoding":
+            scale = font_size / 1000.0
+            for code, width in enumerate(widths):
+                char = bytes([code]).decode("cp1252", errors="ignore")
+                if char:
+                    self._widths[char] = width * scale
+
+    def char_width(self, char: str) -> float:
+        width = self._widths.get(char)
+        if width is None:
+            # Anything outside the table is measured once and remembered
+            width = _pdfmetrics().stringWidth(char, self.font, self.font_size)
+            self._widths[char] = width
+        return width
+
+    def text_width(self, text: str) -> float:
+        widths = self._widths
+        total = 0.0
+        for char in text:
+            width = widths.get(char)
+            total += width if width is not None else self.char_width(char)
+        return total
+
+
+@lru_cache(maxsize=64)
+def get_width_table(font: str, font_size: float) -> WidthTable:
+    """Return the (shared) width table for a font and size"""
+    return WidthTable(font, font_size)
+
+
+def text_width(text: str, font: str = "Helvetica", font_size: float = 12) -> float:
+    """Width of text in points"""
+    return get_width_table(font, font_size).text_width(text)
+
+
+@lru_cache(maxsize=4096)
+def wrap_line(line: str, max_width: float, font: str = "Helvetica", font_size: float = 12) -> Tuple[str, ...]:
+    """
+    Break a single line (no newlines) into lines that fit max_width.
+
+    Words are packed greedily; a word wider than max_width on its own is split
+    between characters.
+    """
+    if not line:
+        return (line,)
+
+    table = get_width_table(font, font_size)
+    if table.text_width(line) <= max_width:
+        return (line,)
+
+    space_width = table.char_width(" ")
+    lines: List[str] = []
+    current = ""
+    current_width = 0.0
+
+    for word in line.split():
+        word_width = table.text_width(word)
+
+        if word_width > max_width:
+            # Flush the current line, then hard-break the long word
+            if current:
+                lines.append(current)
+                current, current_width = "", 0.0
+            for char in word:
+                char_width = table.char_width(char)
+                if current and current_width + char_width > max_width:
+                    lines.append(current)
+                    current, current_width = "", 0.0
+                current += char
+                current_width += char_width
+            continue
+
+        if not current:
+            current, current_width = word, word_width
+        elif current_width + space_width + word_width <= max_width:
+            current += " " + word
+            current_width += space_width + word_width
+        else:
+            lines.append(current)
+            current, current_width = word, word_width
+
+    if current or not lines:
+        lines.append(current)
+    return tuple(lines)
+
+
+def wrap_text(text: str, max_width: float, font: str = "Helvetica", font_size: float = 12) -> List[str]:
+    """Wrap multi-line text; existing line breaks are kept"""
+    lines: List[str] = []
+    for line in str(text).split("\n"):
+        lines.extend(wrap_line(line, max_width, font, font_size))
+    return lines
+
+
+def fits_box(text: str, max_width: float, max_height: float, font: str, font_size: float, leading: float) -> bool:
+    """
+    Check whether wrapped text fits a box.
+
+    max_height is measured from the first baseline down to the bottom of the box.
+    """
+    line_count = len(wrap_text(text, max_width, font, font_size))
+    if line_count == 1 and not text:
+        return True
+    _, descent = _pdfmetrics().getAscentDescent(font, font_size)
+    return (line_count - 1) * leading - descent <= max_height
+
+
+@lru_cache(maxsize=1024)
+def fit_font_size(text: str, max_width: float, max_height: float, font: str = "Helvetica", font_size: float = 12, line_spacing: float = 14, min_font_size: float = 6, step: float = 0.25) -> Tuple[float, float]:
+    """
+    Find the largest font size (up to font_size) at which text fits the box.
+
+    Returns (font_size, leading); the leading keeps the line_spacing / font_size ratio.
+    Sizes are binary searched in `step` increments, since fewer lines always fit
+    at smaller sizes. If nothing fits, the minimum size is returned, or font_size
+    if that is already smaller.
+    """
+    ratio = line_spacing / font_size
+    if fits_box(text, max_width, max_height, font, font_size, line_spacing):
+        return font_size, line_spacing
+    # Never grow the text: below the minimum there is nothing left to try
+    min_font_size = min(min_font_size, font_size)
+
+    # Candidate sizes min_font_size, min_font_size + step, ... below font_size
+    steps = int((font_size - min_font_size) / step)
+    low, high = 0, steps - 1
+    best = 0
+    while low <= high:
+        mid = (low + high) // 2
+        size = min_font_size + mid * step
+        if fits_box(text, max_width, max_height, font, size, size * ratio):
+            best = mid
+            low = mid + 1
+        else:
+            high = mid - 1
+
+    size = min_font_size + best * step
+    return size, size * ratio
@@ -0,0 +1,330 @@
+"""
+Import of timesheets (CSV) and calendar exports (ICS) into week records.
+
+Entries are read one at a time and added to the totals of their training week:
+per report section the hours and the entry titles (each title once, with its
+hours). Nothing else is kept, so a year of timesheet rows is imported in a
+single pass with memory bounded by the number of weeks.
+
+The section of an entry comes from its category or project, else from its
+title (see notes.SECTIONS): "Berufsschule" is school, "Schulung" an
+instruction, everything else work.
+
+CSV columns are recognized by their header (Datum/Date, Stunden/Hours/Dauer,
+Tätigkeit/Description/Task, Kategorie/Category/Projekt, or Start and Ende
+times instead of hours), separated by ',', ';' or tabs. Of split date and time
+columns (Toggl: Start date, Start time, End date, End time) the times are used.
+Rows without a date or hours are skipped and their line numbers reported. ICS files contribute
+their VEVENTs; all-day events count hours_per_day for every weekday they
+cover. Recurring events (RRULE) are taken once, at their first occurrence.
+"""
+import csv
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+from datetime import date, datetime, timedelta, timezone
+from itertools import chain
+from typing import Dict, Iterable, Iterator, List, Optional
+from schemas import WeekRecord
+from notes import find_date, section_for
+from training_calendar import DATE_FORMATS, TrainingCalendar, format_date
+
+TIMESHEET_FORMATS = ("timesheet", "ics")
+
+# Titles listed per week and section; further titles only add their hours
+MAX_TITLES = 10
+# Distinct titles remembered per week and section to pick those with the most hours from
+_TITLE_LIMIT = 50
+
+_DATE_COLUMNS = ("datum", "date", "tag", "day")
+_HOURS_COLUMNS = ("stunden", "std", "hours", "dauer", "duration", "arbeitszeit")
+_TITLE_COLUMNS = ("tätigkeit", "taetigkeit", "beschreibung", "description", "activity", "aufgabe", "task", "titel", "title", "summary", "notiz", "note", "kommentar", "comment")
+_CATEGORY_COLUMNS = ("kategorie", "category", "projekt", "project", "art", "typ", "type")
+_START_COLUMNS = ("start", "beginn", "von", "from")
+_END_COLUMNS = ("ende", "end", "bis", "to")
+# Preferred over the above when dates and times have separate columns
+_START_TIME_COLUMNS = ("start time", "startzeit", "beginn zeit", "uhrzeit von")
+_END_TIME_COLUMNS = ("end time", "endzeit", "ende zeit", "uhrzeit bis")
+
+_TIME_RE = re.compile(r"(\d{1,2}):(\d{2})(?::(\d{2}))?")
+_NUMBER_RE = re.compile(r"-?\d+(?:[.,]\d+)?")
+_ICS_DURATION_RE = re.compile(r"P(?:(\d+)W)?(?:(\d+)D)?(?:T(?:(\d+)H)?(?:(\d+)M)?(?:(\d+)S)?)?")
+
+
+@dataclass(frozen=True, slots=True)
+class Entry:
+    """One timesheet row or calendar event"""
+    day: date
+    hours: float
+    title: str
+    category: str = ""
+
+
+def parse_hours(text: str) -> Optional[float]:
+    """Hours from "7,5", "7.5", "7:30" or "07:30:00"; None if there are none"""
+    text = text.strip()
+    match = _TIME_RE.fullmatch(text)
+    if match:
+        hours, minutes, seconds = match.groups()
+        return int(hours) + int(minutes) / 60 + int(seconds or 0) / 3600
+    match = _NUMBER_RE.search(text)
+    if match:
+        return float(match.group(0).replace(",", "."))
+    return None
+
+
+@lru_cache(maxsize=1024)
+def _parse_day(text: str) -> Optional[date]:
+    # Timesheets repeat the same day on many rows
+    return find_date(text)
+
+
+@lru_cache(maxsize=4096)
+def _section(category: str, title: str) -> str:
+    """Text field of the report section an entry belongs to"""
+    return (section_for(category) or section_for(title) or ("texts_1", "hour_1"))[0]
+
+
+def _find_column(header: List[str], keywords: Iterable[str], taken: Iterable[int] = ()) -> Optional[int]:
+    names = [name.strip().lower() for name in header]
+    for keyword in keywords:
+        for index, name in enumerate(names):
+            if index not in taken and (name == keyword or name.startswith(keyword + " ") or name.startswith(keyword + "(")):
+                return index
+    # "Dauer in h", "Start time": longer keywords may appear anywhere in the name
+    for keyword in keywords:
+        for index, name in enumerate(names):
+            if index not in taken and len(keyword) > 3 and keyword in name:
+                return index
+    return None
+
+
+def iter_csv_entries(lines: Iterable[str], skipped: Optional[List[int]] = None) -> Iterator[Entry]:
+    """
+    Entries of a CSV timesheet, read row by row.
+
+    Rows without a date or hours are skipped; their line numbers are appended to skipped.
+    """
+    lines = iter(lines)
+    first_line = next(lines, "")
+    delimiter = max(",;\t", key=first_line.count)
+    reader = csv.reader(chain([first_line], lines), delimiter=delimiter)
+    header = next(reader, None)
+    if not header:
+        return
+
+    date_column = _find_column(header, _DATE_COLUMNS)
+    taken = {date_column}
+    hours_column = _find_column(header, _HOURS_COLUMNS, taken)
+    taken.add(hours_column)
+    title_column = _find_column(header, _TITLE_COLUMNS, taken)
+    taken.add(title_column)
+    category_column = _find_column(header, _CATEGORY_COLUMNS, taken)
+    taken.add(category_column)
+    start_column = _find_column(header, _START_TIME_COLUMNS, taken)
+    if start_column is None:
+        start_column = _find_column(header, _START_COLUMNS, taken)
+    taken.add(start_column)
+    end_column = _find_column(header, _END_TIME_COLUMNS, taken)
+    if end_column is None:
+        end_column = _find_column(header, _END_COLUMNS, taken)
+    if date_column is None:
+        # Some exports only have start and end timestamps
+        date_column = start_column
+    if date_column is None or (hours_column is None and (start_column is None or end_column is None)):
+        raise ValueError(f"no date and hours columns found in {', '.join(header)}")
+
+    def cell(row: List[str], column: Optional[int]) -> str:
+        return row[column] if column is not None and column < len(row) else ""
+
+    for row in reader:
+        if not any(value.strip() for value in row):
+            continue
+        day = _parse_day(cell(row, date_column))
+        if day is None:
+            if skipped is not None:
+                skipped.append(reader.line_num)
+            continue
+        if hours_column is not None:
+            hours = parse_hours(cell(row, hours_column))
+        else:
+            start = _TIME_RE.search(cell(row, start_column))
+            end = _TIME_RE.search(cell(row, end_column))
+            hours = None
+            if start and end:
+                minutes = (int(end.group(1)) * 60 + int(end.group(2))) - (int(start.group(1)) * 60 + int(start.group(2)))
+                hours = (minutes % (24 * 60)) / 60
+        if not hours:
+            if skipped is not None:
+                skipped.append(reader.line_num)
+            continue
+        yield Entry(day, hours, cell(row, title_column).strip(), cell(row, category_column).strip())
+
+
+def _ics_unfold(lines: Iterable[str]) -> Iterator[str]:
+    current = None
+    for line in lines:
+        line = line.rstrip("\r\n")
+        if line[:1] in (" ", "\t") and current is not None:
+            current += line[1:]
+            continue
+        if current is not None:
+            yield current
+        current = line
+    if current is not None:
+        yield current
+
+
+def _ics_text(value: str) -> str:
+    return re.sub(r"\\([\\;,nN])", lambda match: "\n" if match.group(1) in "nN" else match.group(1), value)
+
+
+def _ics_datetime(value: str, params: str):
+    """date for all-day values, local datetime otherwise"""
+    value = value.strip()
+    if len(value) == 8 or "VALUE=DATE" in params.upper().replace("VALUE=DATE-TIME", ""):
+        return datetime.strptime(value[:8], "%Y%m%d").date()
+    parsed = datetime.strptime(value[:15], "%Y%m%dT%H%M%S")
+    if value.endswith("Z"):
+        parsed = parsed.replace(tzinfo=timezone.utc).astimezone().replace(tzinfo=None)
+    return parsed
+
+
+def _ics_duration(value: str) -> Optional[timedelta]:
+    match = _ICS_DURATION_RE.fullmatch(value.strip().lstrip("+"))
+    if not match:
+        return None
+    weeks, days, hours, minutes, seconds = (int(part or 0) for part in match.groups())
+    return timedelta(weeks=weeks, days=days, hours=hours, minutes=minutes, seconds=seconds)
+
+
+def iter_ics_entries(lines: Iterable[str], hours_per_day: float = 8) -> Iterator[Entry]:
+    """Entries of an iCalendar file, one VEVENT at a time"""
+    event: Optional[Dict[str, tuple]] = None
+    for line in _ics_unfold(lines):
+        if line == "BEGIN:VEVENT":
+            event = {}
+            continue
+        if event is None:
+            continue
+        if line == "END:VEVENT":
+            yield from _event_entries(event, hours_per_day)
+            event = None
+            continue
+        name, _, value = line.partition(":")
+        name, _, params = name.partition(";")
+        event[name.upper()] = (params, value)
+
+
+def _event_entries(event: Dict[str, tuple], hours_per_day: float) -> Iterator[Entry]:
+    if "DTSTART" not in event or event.get("STATUS", ("", ""))[1].upper() == "CANCELLED":
+        return
+    title = _ics_text(event.get("SUMMARY", ("", ""))[1]).strip()
+    category = _ics_text(event.get("CATEGORIES", ("", ""))[1]).split(",")[0].strip()
+    start = _ics_datetime(event["DTSTART"][1], event["DTSTART"][0])
+    if "DTEND" in event:
+        end = _ics_datetime(event["DTEND"][1], event["DTEND"][0])
+    else:
+        end = start + (_ics_duration(event.get("DURATION", ("", ""))[1]) or (timedelta(days=1) if not isinstance(start, datetime) else timedelta()))
+
+    if isinstance(start, datetime):
+        hours = (end - start).total_seconds() / 3600
+        if hours > 0:
+            yield Entry(start.date(), hours, title, category)
+        return
+
+    # All-day events: a full day's hours for every weekday they cover
+    day = start
+    while day < end:
+        if day.weekday() < 5:
+            yield Entry(day, hours_per_day, title, category)
+        day += timedelta(days=1)
+
+
+class WeekTotals:
+    """Hours and titles of one training week, per report section"""
+
+    __slots__ = ("hours", "titles")
+
+    def __init__(self):
+        self.hours: Dict[str, float] = {}
+        self.titles: Dict[str, Dict[str, float]] = {}  # text field -> title -> hours
+
+    def add(self, text_field: str, title: str, hours: float) -> None:
+        self.hours[text_field] = self.hours.get(text_field, 0.0) + hours
+        if not title:
+            return
+        titles = self.titles.setdefault(text_field, {})
+        if title in titles or len(titles) < _TITLE_LIMIT:
+            titles[title] = titles.get(title, 0.0) + hours
+
+
+def _format_hours(hours: float) -> str:
+    return f"{round(hours, 2):g}"
+
+
+class TimesheetImport:
+    """
+    Sums entries into training weeks; records() returns the weeks found, with dates in date_format.
+
+    skipped holds the line numbers of timesheet rows that had no date or hours.
+    """
+
+    def __init__(self, calendar: Optional[TrainingCalendar] = None, max_titles: int = MAX_TITLES, date_format: str = DATE_FORMATS[0]):
+        self.calendar = calendar
+        self.max_titles = max_titles
+        self.date_format = date_format
+        self.weeks: Dict[date, WeekTotals] = {}
+        self.entries = 0
+        self.skipped: List[int] = []
+
+    def add(self, entry: Entry) -> None:
+        monday = entry.day - timedelta(days=entry.day.weekday())
+        totals = self.weeks.get(monday)
+        if totals is None:
+            totals = self.weeks[monday] = WeekTotals()
+        totals.add(_section(entry.category, entry.title), entry.title, entry.hours)
+        self.entries += 1
+
+    def add_all(self, entries: Iterable[Entry]) -> "TimesheetImport":
+        for entry in entries:
+            self.add(entry)
+        return self
+
+    def records(self) -> List[WeekRecord]:
+        """One record per week with entries, in date order"""
+        records = []
+        for monday in sorted(self.weeks):
+            totals = self.weeks[monday]
+            week = self.calendar.week_of(monday) if self.calendar else None
+            values = {}
+            for index in (1, 2, 3):
+                text_field = f"texts_{index}"
+                titles = totals.titles.get(text_field, {})
+                # The titles with the most hours, in the order they first appeared
+                top = set(sorted(titles, key=titles.get, reverse=True)[:self.max_titles])
+                values[text_field] = "\n".join(title for title in titles if title in top)
+                values[f"hour_{index}"] = _format_hours(totals.hours[text_field]) if text_field in totals.hours else ""
+            records.append(WeekRecord(
+                week_no=str(week.week_no) if week else "",
+                start_date=format_date(monday, self.date_format),
+                end_date=format_date(monday + timedelta(days=4), self.date_format),
+                **values,
+            ))
+        return records
+
+
+def import_timesheet(lines: Iterable[str], input_format: str = "timesheet", calendar: Optional[TrainingCalendar] = None, date_format: str = DATE_FORMATS[0]) -> TimesheetImport:
+    """
+    Import of a CSV timesheet ("timesheet") or an iCalendar export ("ics"); see records() and skipped.
+
+    lines is read once, e.g. an open text file. calendar numbers the weeks,
+    date_format is the format of the records' dates.
+    """
+    result = TimesheetImport(calendar, date_format=date_format)
+    if input_format == "ics":
+        hours_per_day = calendar.hours_per_week / 5 if calendar else 8
+        entries = iter_ics_entries(lines, hours_per_day)
+    else:
+        entries = iter_csv_entries(lines, result.skipped)
+    return result.add_all(entries)
@@ -0,0 +1,242 @@
+"""
+Training weeks and the dates shown on a report.
+
+A TrainingCalendar is built once from the first training week and holds one row
+per week (week number, Monday, Friday, signature date, workdays and hours after
+nationwide German public holidays). Looking up a week by number or by date is
+an index into that table.
+
+Dates are entered as DD/MM/YYYY, DD-MM-YYYY or DD.MM.YYYY and parsing them is
+cached. Dates created by the app (e.g. "This Week") are written in the format
+of a date the user entered, which callers pass explicitly (see date_format_of).
+"""
+import re
+from dataclasses import dataclass
+from datetime import date, timedelta
+from functools import lru_cache
+from typing import Dict, Iterator, List, Optional, Tuple
+
+DATE_FORMATS = ("%d/%m/%Y", "%d-%m-%Y", "%d.%m.%Y")
+
+_DATE_RE = re.compile(r"\s*(\d{1,2})([/.-])(\d{1,2})\2(\d{4})\s*")
+_SEPARATOR_FORMATS = {"/": "%d/%m/%Y", "-": "%d-%m-%Y", ".": "%d.%m.%Y"}
+
+
+@lru_cache(maxsize=1024)
+def _parse(date_str: str) -> Optional[Tuple[date, str]]:
+    match = _DATE_RE.fullmatch(date_str)
+    if match is None:
+        return None
+    day, separator, month, year = match.groups()
+    try:
+        return date(int(year), int(month), int(day)), _SEPARATOR_FORMATS[separator]
+    except ValueError:
+        return None
+
+
+def parse_date_and_format(date_str: str) -> Optional[Tuple[date, str]]:
+    """Parse a date in one of DATE_FORMATS; returns (date, format) or None"""
+    return _parse(date_str)
+
+
+def parse_date(date_str: str) -> Optional[date]:
+    """Parse a date in one of the supported formats (DD/MM/YYYY, DD-MM-YYYY, DD.MM.YYYY)"""
+    parsed = parse_date_and_format(date_str)
+    return parsed[0] if parsed else None
+
+
+def date_format_of(date_str: str, default: str = DATE_FORMATS[0]) -> str:
+    """Format of a date the user entered, or default if it can't be parsed"""
+    parsed = _parse(date_str)
+    return parsed[1] if parsed else default
+
+
+def format_date(value: date, fmt: str = DATE_FORMATS[0]) -> str:
+    """Format a date as DD?MM?YYYY in fmt, one of DATE_FORMATS"""
+    separator = fmt[2]
+    return f"{value.day:02d}{separator}{value.month:02d}{separator}{value.year:04d}"
+
+
+def easter_sunday(year: int) -> date:
+    """Easter Sunday in the Gregorian calendar (anonymous Gregorian algorithm)"""
+    a = year % 19
+    b, c = divmod(year, 100)
+    d, e = divmod(b, 4)
+    f = (b + 8) // 25
+    g = (b - f + 1) // 3
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = divmod(c, 4)
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * l) // 451
+    month, day = divmod(h + l - 7 * m + 114, 31)
+    return date(year, month, day + 1)
+
+
+@lru_cache(maxsize=64)
+def german_holidays(year: int) -> Dict[date, str]:
+    """Public holidays observed in every German state"""
+    easter = easter_sunday(year)
+    return {
+        date(year, 1, 1): "Neujahr",
+        easter - timedelta(days=2): "Karfreitag",
+        easter + timedelta(days=1): "Ostermontag",
+        date(year, 5, 1): "Tag der Arbeit",
+        easter + timedelta(days=39): "Christi Himmelfahrt",
+        easter + timedelta(days=50): "Pfingstmontag",
+        date(year, 10, 3): "Tag der Deutschen Einheit",
+        date(year, 12, 25): "1. Weihnachtstag",
+        date(year, 12, 26): "2. Weihnachtstag",
+    }
+
+
+@dataclass(frozen=True, slots=True)
+class TrainingWeek:
+    """One row of the calendar table"""
+    week_no: int
+    monday: date
+    friday: date
+    sign_date: date  # last workday of the week
+    workdays: int
+    hours: float
+    holidays: Tuple[str, ...] = ()
+
+    def scale_hours(self, hours: str) -> str:
+        """Reduce an hours value for a full week to this week's workdays ("40" -> "32" with one holiday)"""
+        if self.workdays == 5:
+            return hours
+        text = hours.strip()
+        try:
+            value = float(text.replace(",", "."))
+        except ValueError:
+            return hours
+        scaled = f"{value * self.workdays / 5:g}"
+        return scaled.replace(".", ",") if "," in text else scaled
+
+
+class TrainingCalendar:
+    """Precomputed table of all training weeks, starting at the week of first_day"""
+
+    def __init__(self, first_day: date, weeks: int = 156, first_week_no: int = 1, hours_per_week: float = 40):
+        self.first_monday = first_day - timedelta(days=first_day.weekday())
+        self.first_week_no = first_week_no
+        self.hours_per_week = hours_per_week
+        self._weeks: List[TrainingWeek] = [self._build_week(index) for index in range(weeks)]
+
+    def _build_week(self, index: int) -> TrainingWeek:
+        monday = self.first_monday + timedelta(weeks=index)
+        workdays = []
+        holidays = []
+        for offset in range(5):
+            day = monday + timedelta(days=offset)
+            name = german_holidays(day.year).get(day)
+            if name is None:
+                workdays.append(day)
+            else:
+                holidays.append(name)
+        return TrainingWeek(
+            week_no=self.first_week_no + index,
+            monday=monday,
+            friday=monday + timedelta(days=4),
+            sign_date=workdays[-1] if workdays else monday + timedelta(days=4),
+            workdays=len(workdays),
+            hours=self.hours_per_week * len(workdays) / 5,
+            holidays=tuple(holidays),
+        )
+
+    def __len__(self) -> int:
+        return len(self._weeks)
+
+    def __iter__(self) -> Iterator[TrainingWeek]:
+        return iter(self._weeks)
+
+    def week(self, week_no: int) -> Optional[TrainingWeek]:
+        """Row for a week number"""
+        index = week_no - self.first_week_no
+        if 0 <= index < len(self._weeks):
+            return self._weeks[index]
+        return None
+
+    def week_of(self, day: date) -> Optional[TrainingWeek]:
+        """Row of the week containing day"""
+        return self.week(self.first_week_no + (day - self.first_monday).days // 7)
+
+    def weeks_between(self, first_day: date, last_day: date) -> List[TrainingWeek]:
+        """Rows of all weeks from the one containing first_day up to the one containing last_day"""
+        start = max((first_day - self.first_monday).days // 7, 0)
+        stop = (last_day - self.first_monday).days // 7 + 1
+        return self._weeks[start:max(stop, start)]
+
+
+@lru_cache(maxsize=8)
+def get_calendar(first_monday: date, first_week_no: int = 1, weeks: int = 156) -> TrainingCalendar:
+    """Shared calendar for a training start week"""
+    return TrainingCalendar(first_monday, weeks=weeks, first_week_no=first_week_no)
+
+
+def calendar_for_week(week_no: str, date_str: str) -> Optional[TrainingCalendar]:
+    """Calendar implied by the week number and a date of the week shown in the form"""
+    day = parse_date(date_str)
+    if day is None:
+        return None
+    number = int(week_no) if week_no.strip().isdigit() else 1
+    number = max(number, 1)
+    first_monday = day - timedelta(days=day.weekday(), weeks=number - 1)
+    return get_calendar(first_monday)
+
+
+@lru_cache(maxsize=256)
+def _week_sign_date(monday: date) -> date:
+    return TrainingCalendar(monday, weeks=1).week(1).sign_date
+
+
+def sign_date_for(end_date_str: str) -> str:
+    """
+    Signature date of a report ending on end_date_str: the last workday up to it.
+
+    A week ending on a public holiday (e.g. Karfreitag) is signed the day before.
+    Dates that can't be parsed are returned unchanged.
+    """
+    parsed = parse_date_and_format(end_date_str)
+    if parsed is None:
+        return end_date_str
+    day, fmt = parsed
+    sign_date = min(day, _week_sign_date(day - timedelta(days=day.weekday())))
+    return format_date(sign_date, fmt)
+
+
+def compute_end_date_from_start(start_date_str: str) -> str:
+    """
+    Compute end date (Friday) from start date (Monday).
+    Supports formats: DD/MM/YYYY, DD-MM-YYYY, DD.MM.YYYY
+    """
+    parsed = parse_date_and_format(start_date_str)
+    if parsed is None:
+        return ""  # Could not parse date
+    start_date, fmt = parsed
+    # Add 4 days to get from Monday to Friday (Monday + 4 days = Friday)
+    return format_date(start_date + timedelta(days=4), fmt)
+
+
+def get_week_dates(base_date_str: str, weeks_offset: int, fmt: str = DATE_FORMATS[0]) -> tuple[str, str]:
+    """
+    Get Monday and Friday dates for a week relative to base_date.
+
+    Args:
+        base_date_str: Current date string in any supported format
+        weeks_offset: Number of weeks to add/subtract (negative for previous weeks)
+        fmt: Format of the result if base_date_str is empty
+
+    Returns:
+        Tuple of (monday_str, friday_str) in the same format as input
+    """
+    if not base_date_str.strip():
+        # If no base date, use current date
+        base_date = date.today()
+    else:
+        parsed = parse_date_and_format(base_date_str)
+        if parsed is None:
+            return "", ""
+        base_date, fmt = parsed
+
+    target_monday = base_date - timedelta(days=base_date.weekday()) + timedelta(weeks=weeks_offset)
+    return format_date(target_monday, fmt), format_date(target_monday + timedelta(days=4), fmt)
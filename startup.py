@@ -15,5 +15,7 @@ def run_app():
     from main import main
     main()
 
-if __name__ in {"__main__", "__mp_main__"}:
+# Not "__mp_main__": the render pool's worker processes import this module under
+# that name on spawn platforms and must not start the app. ui.run never reloads.
+if __name__ == "__main__":
     run_app()